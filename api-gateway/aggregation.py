@@ -0,0 +1,121 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+
+# call(servicio, ruta, query params) -> respuesta del servicio
+ServiceCall = Callable[[str, str, Optional[Dict[str, Any]]], Awaitable[httpx.Response]]
+# post(servicio, ruta, cuerpo JSON) -> respuesta del servicio
+ServicePost = Callable[[str, str, Any], Awaitable[httpx.Response]]
+
+
+class Budget:
+    """Tiempo total disponible para todas las llamadas de una petición compuesta."""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+
+async def fetch_json(call: ServiceCall, budget: Budget, service: str, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    """GET a un servicio limitado por lo que queda del presupuesto; lanza excepción si falla."""
+    response = await asyncio.wait_for(call(service, path, params), budget.remaining())
+    response.raise_for_status()
+    return response.json()
+
+
+def describe_error(error: BaseException) -> str:
+    if isinstance(error, asyncio.TimeoutError):
+        return "Tiempo de espera agotado"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    if isinstance(error, HTTPException):
+        return f"HTTP {error.status_code}: {error.detail}"
+    return str(error) or error.__class__.__name__
+
+
+async def order_details(call: ServiceCall, order_id: int, timeout: float) -> Dict[str, Any]:
+    """
+    Orden con sus productos y pagos en un solo documento.
+
+    Los productos (en una sola consulta por lote) y los pagos se consultan en paralelo. Si alguna
+    de esas llamadas falla, la respuesta se entrega igual con `partial=True` y
+    el detalle en `errors`; solo la orden es obligatoria.
+    """
+    budget = Budget(timeout)
+    try:
+        order = await fetch_json(call, budget, "orders", f"/orders/{order_id}")
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=f"Orden: {describe_error(e)}")
+    except asyncio.TimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"Orden: {describe_error(e)}")
+
+    product_ids = sorted({item["product_id"] for item in order.get("items", [])})
+    products_call = (
+        fetch_json(call, budget, "products", "/products/batch", {"ids": ",".join(map(str, product_ids))})
+        if product_ids else asyncio.sleep(0, [])
+    )
+    found, payments = await asyncio.gather(
+        products_call,
+        fetch_json(call, budget, "payments", "/payments/", {"order_id": order_id}),
+        return_exceptions=True,
+    )
+
+    errors: List[Dict[str, Any]] = []
+    products: Dict[int, Any] = {}
+    if isinstance(found, BaseException):
+        errors.append({"service": "products", "product_ids": product_ids, "error": describe_error(found)})
+    else:
+        products = {product["id"]: product for product in found}
+
+    if isinstance(payments, BaseException):
+        errors.append({"service": "payments", "error": describe_error(payments)})
+        payments = None
+
+    return {
+        "order": {key: value for key, value in order.items() if key != "items"},
+        "items": [{**item, "product": products.get(item["product_id"])} for item in order.get("items", [])],
+        "payments": payments,
+        "partial": bool(errors),
+        "errors": errors,
+    }
+
+
+async def orders_with_clients(call: ServiceCall, post: ServicePost, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """
+    Órdenes que incluyen alguno de los productos indicados, cada una con el perfil de su cliente.
+
+    Los perfiles se piden en una sola consulta por lote al servicio de autenticación.
+    Si esa consulta falla, las órdenes se entregan igual con `partial=True`.
+    """
+    budget = Budget(timeout)
+    try:
+        response = await asyncio.wait_for(call("orders", "/orders/by-product", params), budget.remaining())
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=f"Órdenes: {describe_error(e)}")
+    except asyncio.TimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"Órdenes: {describe_error(e)}")
+    orders = response.json()
+
+    errors: List[Dict[str, Any]] = []
+    clients: Dict[str, Any] = {}
+    emails = sorted({order["user_email"] for order in orders})
+    if emails:
+        try:
+            users = await asyncio.wait_for(post("auth", "/users/batch", {"emails": emails}), budget.remaining())
+            users.raise_for_status()
+            clients = {user["email"]: user for user in users.json()}
+        except Exception as e:
+            errors.append({"service": "auth", "error": describe_error(e)})
+
+    return {
+        "orders": [{**order, "client": clients.get(order["user_email"])} for order in orders],
+        "next_cursor": response.headers.get("x-next-cursor"),
+        "partial": bool(errors),
+        "errors": errors,
+    }
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import random
+from typing import Any, Dict, List
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+LEAST_OUTSTANDING = "least_outstanding"
+POWER_OF_TWO = "p2c"
+
+
+class Replica:
+    """Una instancia de un servicio, con su propio pool de conexiones."""
+
+    def __init__(self, url: str, client: httpx.AsyncClient):
+        self.url = url
+        self.client = client
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+
+
+class ReplicaPool:
+    """
+    Réplicas de un servicio con balanceo por menor número de peticiones en curso.
+
+    Con la estrategia `p2c` se eligen dos réplicas al azar y se usa la menos
+    ocupada. Una réplica se expulsa tras `eject_after` fallos seguidos (del
+    health check o de conexión) y se readmite tras `readmit_after` health
+    checks correctos.
+    """
+
+    def __init__(self, name: str, replicas: List[Replica], strategy: str, eject_after: int, readmit_after: int):
+        self.name = name
+        self.replicas = replicas
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.readmit_after = readmit_after
+
+    def pick(self) -> Replica:
+        # Si todas están expulsadas se intenta con cualquiera antes que fallar sin llamar
+        candidates = [replica for replica in self.replicas if replica.healthy] or self.replicas
+        if self.strategy == POWER_OF_TWO and len(candidates) > 2:
+            candidates = random.sample(candidates, 2)
+        return min(candidates, key=lambda replica: (replica.outstanding, random.random()))
+
+    def report(self, replica: Replica, ok: bool):
+        if ok:
+            replica.consecutive_failures = 0
+            replica.consecutive_successes += 1
+            if not replica.healthy and replica.consecutive_successes >= self.readmit_after:
+                replica.healthy = True
+                logger.info(f"Réplica {replica.url} de {self.name} readmitida")
+            return
+        replica.consecutive_successes = 0
+        replica.consecutive_failures += 1
+        if replica.healthy and replica.consecutive_failures >= self.eject_after:
+            replica.healthy = False
+            logger.warning(f"Réplica {replica.url} de {self.name} expulsada")
+
+    async def check(self, replica: Replica, timeout: float):
+        try:
+            # /ready y no /health: una réplica sin base conectada o sin migrar no recibe tráfico
+            response = await replica.client.get("/ready", timeout=timeout)
+            self.report(replica, response.status_code == 200)
+        except httpx.RequestError:
+            self.report(replica, False)
+
+    async def run_health_checks(self, interval: float, timeout: float):
+        while True:
+            await asyncio.gather(*(self.check(replica, timeout) for replica in self.replicas))
+            await asyncio.sleep(interval)
+
+    async def aclose(self):
+        for replica in self.replicas:
+            await replica.client.aclose()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"url": replica.url, "healthy": replica.healthy, "outstanding": replica.outstanding}
+            for replica in self.replicas
+        ]
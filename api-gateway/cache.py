@@ -0,0 +1,91 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+
+@dataclass
+class CachedResponse:
+    """Respuesta de un servicio guardada completa en memoria."""
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    etag: str = ""
+
+
+def make_etag(body: bytes) -> str:
+    """Genera un ETag fuerte a partir del contenido de la respuesta."""
+    return '"' + hashlib.sha256(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Indica si el header `If-None-Match` del cliente coincide con el ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # La comparación débil es la indicada para If-None-Match (RFC 7232)
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ResponseCache:
+    """Cache LRU con TTL de respuestas, indexada por método, ruta y query string."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Se incrementa en cada invalidación; quien consulta al servicio la toma antes de pedir
+        self.generation = 0
+        # Generación en la que se invalidó cada ruta (sin query), para descartar solo esas al guardar
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        # Las respuestas pedidas antes de esta generación se descartan todas
+        self._floor = 0
+        self._entries: "OrderedDict[str, Tuple[CachedResponse, float]]" = OrderedDict()
+
+    @staticmethod
+    def key(method: str, path: str, query: str) -> str:
+        params = "&".join(sorted(query.split("&"))) if query else ""
+        return f"{method} {path}?{params}"
+
+    @staticmethod
+    def path_of(key: str) -> str:
+        return key.split(" ", 1)[1].split("?", 1)[0]
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def set(self, key: str, response: CachedResponse, generation: int):
+        if generation < self._floor or self._invalidated.get(self.path_of(key), 0) > generation:
+            return
+        self._entries[key] = (response, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, paths: Optional[Iterable[str]] = None):
+        """Descarta las respuestas de `paths` (con cualquier query string), o todas si no se indican."""
+        self.generation += 1
+        if paths is None:
+            self._floor = self.generation
+            self._invalidated.clear()
+            self._entries.clear()
+            return
+        paths = set(paths)
+        for path in paths:
+            self._invalidated[path] = self.generation
+            self._invalidated.move_to_end(path)
+        while len(self._invalidated) > self.max_entries:
+            _, generation = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, generation)
+        for key in [key for key in self._entries if self.path_of(key) in paths]:
+            del self._entries[key]
@@ -0,0 +1,95 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from jose import JWTError, jwt
+
+from common.config import settings
+from common.revocation import Fetch, RevocationFilter, fetch_confirmer
+
+# Tamaño máximo de la cache de tokens verificados
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+
+# Headers de identidad que el gateway garantiza a los servicios
+USER_EMAIL_HEADER = "x-user-email"
+USER_ROLE_HEADER = "x-user-role"
+
+
+class ClaimsCache:
+    """Cache LRU de token -> claims; cada entrada vence junto con el `exp` del token."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[Dict[str, str], float]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[Dict[str, str]]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return claims
+
+    def set(self, token: str, claims: Dict[str, str], expires_at: float):
+        self._entries[token] = (claims, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+claims_cache = ClaimsCache(JWT_CACHE_SIZE)
+
+# jtis revocados, sincronizados desde el servicio de autenticación
+revocations = RevocationFilter()
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Extrae el token de un header `Authorization: Bearer <token>`."""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+
+def verify_token(token: str) -> Optional[Dict[str, str]]:
+    """Verifica localmente un JWT y devuelve sus claims (email y rol), o None si no es válido."""
+    claims = claims_cache.get(token)
+    if claims is not None:
+        return claims
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    email = payload.get("sub")
+    expires_at = payload.get("exp")
+    if email is None or expires_at is None:
+        return None
+    claims = {"email": email, "role": payload.get("role") or "", "jti": payload.get("jti") or ""}
+    claims_cache.set(token, claims, float(expires_at))
+    return claims
+
+
+async def apply_identity(headers: Dict[str, str], fetch_auth: Fetch) -> Dict[str, str]:
+    """
+    Descarta cualquier identidad enviada por el cliente e inyecta la del token verificado.
+
+    Los servicios pueden confiar en `X-User-Email` y `X-User-Role` sin volver a
+    consultar al servicio de autenticación. Un token revocado se trata como si no
+    viniera; `fetch_auth` solo se usa cuando el filtro de revocaciones da positivo.
+    """
+    headers.pop(USER_EMAIL_HEADER, None)
+    headers.pop(USER_ROLE_HEADER, None)
+    token = bearer_token(headers.get("authorization"))
+    claims = verify_token(token) if token else None
+    if claims and claims["jti"] and await revocations.is_revoked(claims["jti"], fetch_confirmer(fetch_auth)):
+        claims = None
+    if claims:
+        headers[USER_EMAIL_HEADER] = claims["email"]
+        headers[USER_ROLE_HEADER] = claims["role"]
+    return headers
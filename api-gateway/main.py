@@ -1,8 +1,24 @@
+import asyncio
+import json
 import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 
+from aggregation import order_details, orders_with_clients
+from common.metrics import instrument_app, registry
+from common.revocation import fetch_loader
+from common.tracing import begin_span, collector, end_span, format_traceparent, instrument_tracing
+from balancer import Replica, ReplicaPool
+from coalescing import SingleFlight
+from resilience import Bulkhead, CircuitBreaker, UpstreamGuard
+from cache import CachedResponse, ResponseCache, etag_matches, make_etag
+from edge_auth import USER_EMAIL_HEADER, USER_ROLE_HEADER, apply_identity, revocations
+
 # Cargar variables de entorno si existe .env
 from dotenv import load_dotenv
 load_dotenv()
@@ -12,41 +28,451 @@ PRODUCTS_SERVICE_URL = os.getenv("PRODUCTS_SERVICE_URL", "http://products-servic
 ORDERS_SERVICE_URL = os.getenv("ORDERS_SERVICE_URL", "http://orders-service:8000")
 PAYMENTS_SERVICE_URL = os.getenv("PAYMENTS_SERVICE_URL", "http://payments-service:8000")
 
-app = FastAPI(title="API Gateway")
+# Pool de conexiones hacia los servicios
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "2"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Balanceo entre réplicas y health checks activos
+LB_STRATEGY = os.getenv("LB_STRATEGY", "least_outstanding")
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "1"))
+REPLICA_EJECT_AFTER = int(os.getenv("REPLICA_EJECT_AFTER", "3"))
+REPLICA_READMIT_AFTER = int(os.getenv("REPLICA_READMIT_AFTER", "2"))
+
+# Reenvío en streaming de cuerpos (petición y respuesta) sin bufferizar en el gateway
+GATEWAY_STREAMING = os.getenv("GATEWAY_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# Cache de respuestas del catálogo de productos
+PRODUCTS_CACHE_ENABLED = os.getenv("PRODUCTS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PRODUCTS_CACHE_TTL = float(os.getenv("PRODUCTS_CACHE_TTL", "30"))
+PRODUCTS_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCTS_CACHE_MAX_ENTRIES", "1024"))
+# Listados con un `limit` mayor no se cachean ni se agrupan: se reenvían en streaming
+PRODUCTS_CACHE_MAX_LIMIT = int(os.getenv("PRODUCTS_CACHE_MAX_LIMIT", "50"))
+
+# Presupuesto de tiempo (segundos) de los endpoints compuestos
+COMPOSITE_TIMEOUT = float(os.getenv("COMPOSITE_TIMEOUT", "3"))
+
+# Servicios cuyos GET idénticos y concurrentes se agrupan en una sola llamada
+COALESCE_ROUTES = [name.strip() for name in os.getenv("COALESCE_ROUTES", "products").split(",") if name.strip()]
+# Servicios cuyas respuestas no dependen del usuario: el token no forma parte de la clave
+IDENTITY_AGNOSTIC_SERVICES = {"products"}
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Rutas que el proxy público no expone: las de operación de todos los servicios (métricas y
+# trazas, para Prometheus y el gateway) y las del servicio de autenticación para uso interno
+INTERNAL_PATHS = ("metrics", "traces")
+INTERNAL_AUTH_PATHS = INTERNAL_PATHS + ("revocations", "users/batch")
+
+
+def service_setting(service: str, name: str, default: str) -> str:
+    """Lee `<SERVICIO>_<NOMBRE>` y, si no existe, el valor común `UPSTREAM_<NOMBRE>`."""
+    return os.getenv(f"{service.upper()}_{name}", os.getenv(f"UPSTREAM_{name}", default))
+
+
+def replica_urls(service: str, default_url: str) -> List[str]:
+    """Lista de réplicas de `<SERVICIO>_SERVICE_URLS` (separadas por coma) o la URL única."""
+    urls = os.getenv(f"{service.upper()}_SERVICE_URLS", "")
+    return [url.strip() for url in urls.split(",") if url.strip()] or [default_url]
+
+
+SERVICES = {
+    "auth": replica_urls("auth", AUTH_SERVICE_URL),
+    "products": replica_urls("products", PRODUCTS_SERVICE_URL),
+    "orders": replica_urls("orders", ORDERS_SERVICE_URL),
+    "payments": replica_urls("payments", PAYMENTS_SERVICE_URL),
+}
+
+# Headers que no deben reenviarse entre saltos (RFC 7230) o que dependen de la conexión
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host",
+}
+
+# Réplicas de cada servicio, cada una con un cliente vivo durante toda la vida del gateway
+pools: Dict[str, ReplicaPool] = {}
+
+
+def create_guard(service: str) -> UpstreamGuard:
+    """Bulkhead y circuit breaker de un servicio, configurables por servicio."""
+    bulkhead = Bulkhead(
+        max_in_flight=int(service_setting(service, "MAX_IN_FLIGHT", "50")),
+        max_queue=int(service_setting(service, "MAX_QUEUE", "100")),
+        queue_timeout=float(service_setting(service, "QUEUE_TIMEOUT", "1")),
+    )
+    breaker = CircuitBreaker(
+        failure_rate=float(service_setting(service, "BREAKER_FAILURE_RATE", "0.5")),
+        slow_call_seconds=float(service_setting(service, "BREAKER_SLOW_CALL_SECONDS", "5")),
+        window=int(service_setting(service, "BREAKER_WINDOW", "50")),
+        min_calls=int(service_setting(service, "BREAKER_MIN_CALLS", "20")),
+        open_seconds=float(service_setting(service, "BREAKER_OPEN_SECONDS", "15")),
+        half_open_max_calls=int(service_setting(service, "BREAKER_HALF_OPEN_CALLS", "3")),
+    )
+    return UpstreamGuard(service, bulkhead, breaker)
+
+
+guards: Dict[str, UpstreamGuard] = {name: create_guard(name) for name in SERVICES}
+single_flights: Dict[str, SingleFlight] = {name: SingleFlight() for name in COALESCE_ROUTES}
+products_cache = ResponseCache(PRODUCTS_CACHE_MAX_ENTRIES, PRODUCTS_CACHE_TTL)
+
 
-async def forward_request(request: Request, base_url: str, path: str):
-    url = f"{base_url}{path}"
-    method = request.method
-    headers = dict(request.headers)
-    body = await request.body()
+def create_client(base_url: str) -> httpx.AsyncClient:
+    """Crea un cliente HTTP con pool de conexiones persistentes hacia una réplica."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=UPSTREAM_HTTP2,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            UPSTREAM_READ_TIMEOUT,
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+        ),
+    )
 
-    async with httpx.AsyncClient() as client:
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for name, urls in SERVICES.items():
+        pools[name] = ReplicaPool(
+            name,
+            [Replica(url, create_client(url)) for url in urls],
+            strategy=LB_STRATEGY,
+            eject_after=REPLICA_EJECT_AFTER,
+            readmit_after=REPLICA_READMIT_AFTER,
+        )
+    background = [
+        asyncio.create_task(pool.run_health_checks(HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT))
+        for pool in pools.values()
+    ]
+    background.append(asyncio.create_task(revocations.run(fetch_loader(fetch_auth))))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        for pool in pools.values():
+            await pool.aclose()
+        pools.clear()
+
+
+app = FastAPI(title="API Gateway", lifespan=lifespan)
+instrument_app(app, "api-gateway")
+instrument_tracing(app, "api-gateway")
+
+UPSTREAM_LATENCY = registry.histogram(
+    "gateway_upstream_request_duration_seconds", "Latencia de las llamadas del gateway a los servicios", ("upstream", "status")
+)
+UPSTREAM_IN_FLIGHT = registry.gauge("gateway_upstream_in_flight", "Llamadas en curso por servicio", ("upstream",))
+UPSTREAM_QUEUED = registry.gauge("gateway_upstream_queued", "Llamadas esperando en el bulkhead", ("upstream",))
+UPSTREAM_CIRCUIT_OPEN = registry.gauge("gateway_upstream_circuit_open", "1 si el circuit breaker no está cerrado", ("upstream",))
+UPSTREAM_REJECTED = registry.gauge("gateway_upstream_rejected", "Llamadas rechazadas por saturación o circuito abierto", ("upstream",))
+REPLICA_HEALTHY = registry.gauge("gateway_replica_healthy", "1 si la réplica recibe tráfico", ("upstream", "replica"))
+COALESCED_REQUESTS = registry.gauge("gateway_coalesced_requests", "GETs atendidos con la llamada de otro", ("upstream",))
+COALESCING_UPSTREAM_CALLS = registry.gauge("gateway_coalescing_upstream_calls", "Llamadas reales de las rutas con agrupación", ("upstream",))
+
+
+def collect_gateway_metrics():
+    for name, guard in guards.items():
+        UPSTREAM_IN_FLIGHT.set(guard.bulkhead.in_flight, upstream=name)
+        UPSTREAM_QUEUED.set(guard.bulkhead.waiting, upstream=name)
+        UPSTREAM_CIRCUIT_OPEN.set(0 if guard.breaker.state == "closed" else 1, upstream=name)
+        UPSTREAM_REJECTED.set(guard.bulkhead.rejected + guard.short_circuited, upstream=name)
+    for name, pool in pools.items():
+        for replica in pool.replicas:
+            REPLICA_HEALTHY.set(1 if replica.healthy else 0, upstream=name, replica=replica.url)
+    for name, single_flight in single_flights.items():
+        COALESCED_REQUESTS.set(single_flight.followers, upstream=name)
+        COALESCING_UPSTREAM_CALLS.set(single_flight.leaders, upstream=name)
+
+
+registry.add_collector(collect_gateway_metrics)
+
+
+def filter_headers(headers) -> Dict[str, str]:
+    """Copia los headers descartando los hop-by-hop."""
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+async def request_content(request: Request):
+    """Devuelve el cuerpo de la petición (como stream en modo streaming), o None si no trae cuerpo."""
+    if "content-length" not in request.headers and "transfer-encoding" not in request.headers:
+        return None
+    if GATEWAY_STREAMING:
+        return request.stream()
+    return await request.body()
+
+
+async def send_to_service(
+    service: str,
+    method: str,
+    path: str,
+    headers: Dict[str, str],
+    content=None,
+    params=None,
+    stream: bool = False,
+) -> httpx.Response:
+    """Envía una petición a una réplica del servicio, pasando por su bulkhead y circuit breaker."""
+    guard = guards[service]
+    pool = pools[service]
+    started = await guard.admit()
+    # Desde acá todo va dentro del try: el lugar en el bulkhead (y la prueba del circuito
+    # semiabierto) se libera aunque falle algo antes de llegar a enviar la petición
+    span = None
+    failed = False
+    status = "error"
+    error = None
+    try:
+        replica = pool.pick()
+        span = begin_span(f"HTTP {method} {service}", kind="client", **{"http.url": f"{replica.url}{path}"})
+        headers = {**headers, "traceparent": format_traceparent(span)}
         try:
-            response = await client.request(
-                method, url, headers=headers, content=body, params=dict(request.query_params)
-            )
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response.json() if response.headers.get("content-type", "").startswith("application/json") else response.text,
-            )
+            upstream_request = replica.client.build_request(method, path, headers=headers, content=content, params=params)
+        except ValueError as e:
+            # P. ej. un header con caracteres no ASCII: es un error del cliente, no del servicio
+            error = e
+            status = "invalid"
+            raise HTTPException(status_code=400, detail="Petición inválida")
+        replica.outstanding += 1
+        failed = True
+        try:
+            response = await replica.client.send(upstream_request, stream=stream)
+            failed = response.status_code >= 500
+            status = str(response.status_code)
+            span.attributes["http.status_code"] = response.status_code
         except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"Error conectando a {base_url}: {str(e)}")
+            error = e
+            pool.report(replica, ok=False)
+            raise HTTPException(status_code=502, detail=f"Error conectando a {replica.url}: {str(e)}")
+        finally:
+            # En streaming el lugar se libera al llegar los headers: el cuerpo lo acota el timeout de lectura
+            replica.outstanding -= 1
+    finally:
+        guard.done(started, failed=failed)
+        UPSTREAM_LATENCY.observe(time.monotonic() - started, upstream=service, status=status)
+        if span is not None:
+            end_span(span, error)
+    return response
+
+
+async def fetch_auth(path: str, params=None) -> httpx.Response:
+    """GET propio del gateway al servicio de autenticación (revocaciones de tokens)."""
+    return await send_to_service("auth", "GET", path, {}, params=params)
+
+
+async def send_upstream(request: Request, service: str, path: str, stream: bool) -> httpx.Response:
+    """Reenvía la petición del cliente al servicio indicado y devuelve su respuesta."""
+    return await send_to_service(
+        service,
+        request.method,
+        path,
+        headers=await apply_identity(filter_headers(request.headers), fetch_auth),
+        content=await request_content(request),
+        params=request.query_params.multi_items(),
+        stream=stream,
+    )
+
+
+def response_headers(response: httpx.Response) -> Dict[str, str]:
+    """Headers de una respuesta ya leída por completo."""
+    # httpx ya descomprimió el cuerpo, así que la codificación y el tamaño originales no aplican
+    headers = filter_headers(response.headers)
+    headers.pop("content-encoding", None)
+    headers.pop("content-length", None)
+    return headers
+
+
+async def fetch_buffered(request: Request, service: str, path: str) -> CachedResponse:
+    """Obtiene la respuesta completa del servicio, lista para cachear o compartir."""
+    response = await send_upstream(request, service, path, stream=False)
+    return CachedResponse(response.status_code, response_headers(response), response.content)
+
+
+def coalescing_key(request: Request, service: str, path: str) -> str:
+    key = ResponseCache.key(request.method, f"/{service}{path}", request.url.query)
+    if service not in IDENTITY_AGNOSTIC_SERVICES:
+        key += "|" + request.headers.get("authorization", "")
+    return key
+
+
+async def fetch_upstream(request: Request, service: str, path: str) -> CachedResponse:
+    """Como fetch_buffered, pero agrupando GETs concurrentes idénticos en las rutas habilitadas."""
+    single_flight = single_flights.get(service)
+    if single_flight is None or request.method != "GET":
+        return await fetch_buffered(request, service, path)
+    key = coalescing_key(request, service, path)
+    return await single_flight.do(key, lambda: fetch_buffered(request, service, path))
+
+
+async def forward_request(request: Request, service: str, path: str, coalesce: bool = True):
+    if coalesce and request.method == "GET" and service in single_flights:
+        shared = await fetch_upstream(request, service, path)
+        return Response(content=shared.body, status_code=shared.status_code, headers=shared.headers)
+
+    response = await send_upstream(request, service, path, stream=GATEWAY_STREAMING)
+
+    if GATEWAY_STREAMING:
+        # Se reenvían los bytes tal como llegan (incluida la compresión), sin decodificar
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers=filter_headers(response.headers),
+            background=BackgroundTask(response.aclose),
+        )
+
+    return Response(content=response.content, status_code=response.status_code, headers=response_headers(response))
+
+
+async def cached_get(request: Request, cache: ResponseCache, service: str, path: str):
+    """Responde un GET desde la cache del gateway, consultando al servicio solo si no está."""
+    key = cache.key(request.method, f"/{service}{path}", request.url.query)
+    cached = cache.get(key)
+    cache_status = "HIT"
+    if cached is None:
+        cache_status = "MISS"
+        generation = cache.generation
+        fetched = await fetch_upstream(request, service, path)
+        if fetched.status_code != 200:
+            return Response(content=fetched.body, status_code=fetched.status_code, headers=fetched.headers)
+        etag = make_etag(fetched.body)
+        cached = CachedResponse(fetched.status_code, {**fetched.headers, "etag": etag}, fetched.body, etag)
+        cache.set(key, cached, generation)
+
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers={"etag": cached.etag, "x-cache": cache_status})
+    return Response(
+        content=cached.body,
+        status_code=cached.status_code,
+        headers={**cached.headers, "x-cache": cache_status},
+    )
+
+async def internal_headers(request: Request) -> Dict[str, str]:
+    """Headers para las llamadas que el gateway hace por su cuenta en nombre del cliente."""
+    headers = await apply_identity(filter_headers(request.headers), fetch_auth)
+    headers.pop("content-length", None)
+    headers.pop("content-type", None)
+    return headers
+
+
+# Antes que /composite/orders/{order_id}, que si no tomaría "by-product" como id
+@app.get("/composite/orders/by-product")
+async def composite_orders_by_product(request: Request):
+    headers = await internal_headers(request)
+
+    async def call(service: str, path: str, params=None) -> httpx.Response:
+        return await send_to_service(service, "GET", path, headers, params=params)
+
+    async def post(service: str, path: str, body) -> httpx.Response:
+        return await send_to_service(
+            service, "POST", path, {**headers, "content-type": "application/json"}, content=json.dumps(body)
+        )
+
+    return await orders_with_clients(call, post, dict(request.query_params), COMPOSITE_TIMEOUT)
+
+@app.get("/composite/orders/{order_id}")
+async def composite_order(request: Request, order_id: int):
+    headers = await internal_headers(request)
+
+    async def call(service: str, path: str, params=None) -> httpx.Response:
+        return await send_to_service(service, "GET", path, headers, params=params)
+
+    return await order_details(call, order_id, COMPOSITE_TIMEOUT)
+
+# Rutas del catálogo cuya respuesta depende del usuario
+PRODUCTS_PER_USER_PATHS = ("products/mine",)
+
+# Rutas del catálogo que listan varios productos: cualquier alta, edición o baja las afecta
+PRODUCTS_COLLECTION_PATHS = ("products", "products/", "products/search", "products/batch")
+
+
+def products_cacheable(request: Request, path: str) -> bool:
+    """GETs del catálogo que pasan por la cache: páginas acotadas y sin `Cache-Control: no-store`."""
+    if not path.startswith("products"):
+        return False
+    # Depende de quién pregunta y la clave de la cache no incluye al usuario
+    if path.strip("/") in PRODUCTS_PER_USER_PATHS:
+        return False
+    if "no-store" in request.headers.get("cache-control", ""):
+        return False
+    try:
+        limit = int(request.query_params.get("limit", "0"))
+    except ValueError:
+        return True
+    return limit <= PRODUCTS_CACHE_MAX_LIMIT
+
+def stale_products_paths(path: str) -> Optional[List[str]]:
+    """
+    Rutas de la cache del gateway que deja viejas una escritura en `path`.
+
+    Devuelve una lista vacía si no toca el catálogo (p. ej. las reservas) y None si
+    hay que vaciarla entera (la importación masiva puede cambiar cualquier producto).
+    """
+    parts = path.strip("/").split("/")
+    if parts[0] != "products":
+        return []
+    stale = [f"/products/{collection}" for collection in PRODUCTS_COLLECTION_PATHS]
+    if len(parts) == 1:
+        return stale
+    if len(parts) == 2 and parts[1].isdigit():
+        detail = f"/products/products/{parts[1]}"
+        return stale + [detail, detail + "/"]
+    return None
+
+
+def is_internal_path(path: str, internal_paths=INTERNAL_PATHS) -> bool:
+    path = path.strip("/")
+    return any(path == internal or path.startswith(internal + "/") for internal in internal_paths)
+
+
+def reject_internal_path(path: str, internal_paths=INTERNAL_PATHS):
+    if is_internal_path(path, internal_paths):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+async def require_admin(request: Request):
+    """Los endpoints de diagnóstico del gateway muestran datos de todos los usuarios: solo administradores."""
+    headers = await apply_identity(filter_headers(request.headers), fetch_auth)
+    if not headers.get(USER_EMAIL_HEADER):
+        raise HTTPException(status_code=401, detail="Se requiere un usuario autenticado")
+    if headers.get(USER_ROLE_HEADER) != "admin":
+        raise HTTPException(status_code=403, detail="Solo administradores")
 
 @app.api_route("/auth/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def auth_proxy(request: Request, path: str):
-    return await forward_request(request, AUTH_SERVICE_URL, f"/{path}")
+    reject_internal_path(path, INTERNAL_AUTH_PATHS)
+    return await forward_request(request, "auth", f"/{path}")
 
 @app.api_route("/products/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def products_proxy(request: Request, path: str):
-    return await forward_request(request, PRODUCTS_SERVICE_URL, f"/{path}")
+    reject_internal_path(path)
+    if request.method == "GET" and not products_cacheable(request, path):
+        # Respuestas grandes o que no deben cachearse: pasan en streaming, sin bufferizar
+        return await forward_request(request, "products", f"/{path}", coalesce=False)
+    if PRODUCTS_CACHE_ENABLED and request.method == "GET":
+        return await cached_get(request, products_cache, "products", f"/{path}")
+    response = await forward_request(request, "products", f"/{path}")
+    if request.method in WRITE_METHODS and response.status_code < 400:
+        stale = stale_products_paths(path)
+        if stale is None or stale:
+            products_cache.invalidate(stale)
+    return response
 
 @app.api_route("/orders/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def orders_proxy(request: Request, path: str):
-    return await forward_request(request, ORDERS_SERVICE_URL, f"/{path}")
+    reject_internal_path(path)
+    return await forward_request(request, "orders", f"/{path}")
 
 @app.api_route("/payments/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def payments_proxy(request: Request, path: str):
-    return await forward_request(request, PAYMENTS_SERVICE_URL, f"/{path}")
+    reject_internal_path(path)
+    return await forward_request(request, "payments", f"/{path}")
 
 @app.get("/")
 def root():
@@ -54,4 +480,43 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "service": "api-gateway"}
\ No newline at end of file
+    return {"status": "ok", "service": "api-gateway"}
+
+# No atiende hasta tener cargada la lista de tokens revocados
+@app.get("/ready")
+def ready():
+    if not revocations.synced:
+        raise HTTPException(status_code=503, detail="El servicio todavía no puede atender")
+    return {"status": "ready", "service": "api-gateway"}
+
+@app.get("/gateway/traces/{trace_id}")
+async def gateway_trace(request: Request, trace_id: str):
+    """Traza completa: une los spans del gateway con los que guardó cada réplica de cada servicio."""
+    await require_admin(request)
+    async def fetch_spans(replica: Replica):
+        try:
+            response = await replica.client.get(f"/traces/{trace_id}", timeout=HEALTH_CHECK_TIMEOUT)
+            return response.json() if response.status_code == 200 else []
+        except (httpx.RequestError, ValueError):
+            return []
+
+    replicas = [replica for pool in pools.values() for replica in pool.replicas]
+    results = await asyncio.gather(*(fetch_spans(replica) for replica in replicas))
+    spans = collector.trace(trace_id) + [span for result in results for span in result]
+    spans.sort(key=lambda span: span["start"])
+
+    # Tiempo por servicio según sus spans de servidor
+    by_service: Dict[str, float] = {}
+    for span in spans:
+        if span["kind"] == "server" and span["duration_ms"] is not None:
+            by_service[span["service"]] = by_service.get(span["service"], 0) + span["duration_ms"]
+    return {"trace_id": trace_id, "services_ms": by_service, "spans": spans}
+
+@app.get("/gateway/stats")
+async def gateway_stats(request: Request):
+    await require_admin(request)
+    return {
+        "upstreams": {name: guard.stats() for name, guard in guards.items()},
+        "replicas": {name: pool.stats() for name, pool in pools.items()},
+        "coalescing": {name: single_flight.stats() for name, single_flight in single_flights.items()},
+    }
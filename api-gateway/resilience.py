@@ -0,0 +1,169 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Dict
+
+from fastapi import HTTPException
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+def service_unavailable(detail: str, retry_after: float) -> HTTPException:
+    """Rechazo rápido con la indicación de cuándo reintentar."""
+    return HTTPException(
+        status_code=503,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de error sobre una ventana de las últimas llamadas.
+
+    Las llamadas más lentas que `slow_call_seconds` cuentan como fallidas.
+    Al abrirse rechaza todo durante `open_seconds`; después deja pasar
+    `half_open_max_calls` llamadas de prueba y se cierra solo si todas salen bien.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float,
+        slow_call_seconds: float,
+        window: int,
+        min_calls: int,
+        open_seconds: float,
+        half_open_max_calls: int,
+    ):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: deque = deque(maxlen=window)
+        self._trial_calls = 0
+        self._trial_successes = 0
+
+    def _refresh(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._trial_calls = 0
+            self._trial_successes = 0
+
+    def rejecting(self) -> bool:
+        """Indica, sin reservar turno, si el breaker rechazaría una llamada ahora."""
+        self._refresh()
+        if self.state == OPEN:
+            return True
+        return self.state == HALF_OPEN and self._trial_calls >= self.half_open_max_calls
+
+    def allow(self) -> bool:
+        """Reserva el paso de una llamada; en half-open consume un turno de prueba."""
+        if self.rejecting():
+            return False
+        if self.state == HALF_OPEN:
+            self._trial_calls += 1
+        return True
+
+    def retry_after(self) -> float:
+        if self.state == OPEN:
+            return self.open_seconds - (time.monotonic() - self.opened_at)
+        return 1.0
+
+    def record(self, failed: bool, elapsed: float):
+        failed = failed or elapsed >= self.slow_call_seconds
+        if self.state == HALF_OPEN:
+            if failed:
+                self._trip()
+                return
+            self._trial_successes += 1
+            if self._trial_successes >= self.half_open_max_calls:
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+        self._outcomes.append(failed)
+        if len(self._outcomes) >= self.min_calls and self.error_rate() >= self.failure_rate:
+            self._trip()
+
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+
+
+class Bulkhead:
+    """Limita las llamadas en curso hacia un servicio y el tamaño de su cola de espera."""
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def acquire(self, name: str):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise service_unavailable(f"Servicio {name} saturado", self.queue_timeout)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise service_unavailable(f"Servicio {name} saturado", self.queue_timeout)
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class UpstreamGuard:
+    """Bulkhead + circuit breaker de un servicio del gateway."""
+
+    def __init__(self, name: str, bulkhead: Bulkhead, breaker: CircuitBreaker):
+        self.name = name
+        self.bulkhead = bulkhead
+        self.breaker = breaker
+        self.short_circuited = 0
+
+    async def admit(self) -> float:
+        """Reserva un lugar para llamar al servicio o lanza un 503; devuelve el instante de inicio."""
+        if self.breaker.rejecting():
+            self.short_circuited += 1
+            raise service_unavailable(f"Servicio {self.name} no disponible", self.breaker.retry_after())
+        await self.bulkhead.acquire(self.name)
+        if not self.breaker.allow():
+            self.bulkhead.release()
+            self.short_circuited += 1
+            raise service_unavailable(f"Servicio {self.name} no disponible", self.breaker.retry_after())
+        return time.monotonic()
+
+    def done(self, started: float, failed: bool):
+        """Registra el resultado de la llamada y libera su lugar en el bulkhead."""
+        self.breaker.record(failed, time.monotonic() - started)
+        self.bulkhead.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.state,
+            "error_rate": round(self.breaker.error_rate(), 4),
+            "in_flight": self.bulkhead.in_flight,
+            "queued": self.bulkhead.waiting,
+            "rejected": self.bulkhead.rejected,
+            "short_circuited": self.short_circuited,
+        }
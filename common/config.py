@@ -27,7 +27,7 @@ class Settings(BaseSettings):
     # JWT (autenticación y seguridad)
     SECRET_KEY: str = "supersecretkey"
     ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 5
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,100 @@
+import os
+import time
+from typing import AsyncIterator, Callable, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from common.metrics import DB_POOL_WAIT, instrument_engine
+from common.startup import connect_with_retry
+from common.tracing import trace_engine
+
+# Pool de conexiones por proceso: pool_size abiertas como base y hasta max_overflow extra en picos
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+# Segundos de espera por una conexión libre antes de fallar
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Las conexiones más viejas que esto se reabren (evita cortes de firewalls o del servidor)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Sentencias preparadas que asyncpg guarda por conexión (0 si hay un pgbouncer en modo transacción)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+
+def async_url(url: str) -> str:
+    """Adapta una URL `postgresql://` al driver asyncpg."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def timed_pool(database: str):
+    """
+    Clase de pool que mide cuánto se espera por una conexión libre.
+
+    Solo cuenta la espera en el pool (no el pre-ping) y solo cuando una sesión
+    necesita de verdad una conexión: las peticiones que no consultan la base no
+    toman ninguna.
+    """
+
+    class TimedQueuePool(AsyncAdaptedQueuePool):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                DB_POOL_WAIT.observe(time.perf_counter() - started, database=database)
+
+    return TimedQueuePool
+
+
+def create_database(url: str, database: str) -> Tuple[AsyncEngine, async_sessionmaker]:
+    """
+    Engine asíncrono (asyncpg) con el pool configurado y su fábrica de sesiones.
+
+    Las consultas esperan en el event loop en lugar de ocupar un hilo, así cada
+    réplica atiende tantas peticiones concurrentes como conexiones tenga el pool.
+    """
+    engine = create_async_engine(
+        async_url(url),
+        poolclass=timed_pool(database),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+    )
+    # Los eventos de métricas y trazas se registran sobre el engine síncrono interno
+    instrument_engine(engine.sync_engine, database)
+    trace_engine(engine.sync_engine)
+    # expire_on_commit=False: después del commit los objetos se siguen leyendo sin otra consulta
+    session_factory = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+    return engine, session_factory
+
+
+def session_dependency(session_factory: async_sessionmaker) -> Callable[[], AsyncIterator[AsyncSession]]:
+    """
+    Dependencia de FastAPI que entrega una sesión.
+
+    La sesión toma su conexión del pool recién en la primera consulta, así las
+    respuestas servidas desde una cache no ocupan una conexión ni hacen el pre-ping.
+    """
+
+    async def get_db() -> AsyncIterator[AsyncSession]:
+        async with session_factory() as db:
+            yield db
+
+    return get_db
+
+
+async def ping(engine: AsyncEngine):
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def wait_for_database(engine: AsyncEngine):
+    """Abre la primera conexión del pool con reintentos; se llama desde el lifespan, no al importar."""
+    await connect_with_retry(lambda: ping(engine), "Postgres")
@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from common.metrics import registry
+from common.tracing import current_span, format_traceparent, parse_traceparent, start_span
+
+# Broker de eventos: "redis://host:6379/0" o "memory://" (un solo proceso, solo para pruebas)
+EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL", "redis://localhost:6379/0")
+# El broker en memoria no comunica servicios distintos: hay que habilitarlo explícitamente
+EVENT_BROKER_ALLOW_MEMORY = os.getenv("EVENT_BROKER_ALLOW_MEMORY", "false").lower() in ("1", "true", "yes")
+EVENT_STREAM = os.getenv("EVENT_STREAM", "events")
+# Largo máximo del stream (aproximado en Redis); los eventos más viejos se descartan
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "100000"))
+
+# Relay del outbox y consumidores
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+EVENT_CONSUMER_BATCH = int(os.getenv("EVENT_CONSUMER_BATCH", "100"))
+EVENT_CONSUMER_BLOCK_MS = int(os.getenv("EVENT_CONSUMER_BLOCK_MS", "2000"))
+# Un mensaje entregado y sin confirmar durante este tiempo lo toma otro consumidor del grupo
+# (p. ej. el de una réplica que ya no existe); también es cada cuánto se revisan los pendientes
+EVENT_CLAIM_MIN_IDLE_MS = int(os.getenv("EVENT_CLAIM_MIN_IDLE_MS", "60000"))
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PUBLISHED = registry.counter(
+    "events_published_total", "Eventos publicados desde el outbox", ("type",)
+)
+EVENTS_CONSUMED = registry.counter(
+    "events_consumed_total", "Eventos recibidos por los consumidores", ("group", "type", "result")
+)
+
+# Mensaje leído del broker: (id en el broker, evento)
+Message = Tuple[str, Dict[str, Any]]
+Handler = Callable[[Any, Dict[str, Any]], Awaitable[None]]
+
+
+# -------- Outbox --------
+def outbox_models(Base):
+    """
+    Crea las tablas `outbox_events` y `processed_events` sobre la Base declarativa del servicio.
+
+    El outbox se escribe en la misma transacción que el cambio de estado, así un
+    evento se publica si y solo si el cambio se guardó. `processed_events` guarda
+    los eventos ya aplicados por los consumidores del servicio.
+    """
+    from sqlalchemy import JSON, Column, DateTime, String
+
+    class OutboxEvent(Base):
+        __tablename__ = "outbox_events"
+
+        id = Column(String, primary_key=True)
+        type = Column(String, nullable=False)
+        payload = Column(JSON, nullable=False)
+        traceparent = Column(String, nullable=True)
+        created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    class ProcessedEvent(Base):
+        __tablename__ = "processed_events"
+
+        id = Column(String, primary_key=True)
+        processed_at = Column(DateTime, default=datetime.utcnow)
+
+    return OutboxEvent, ProcessedEvent
+
+
+def add_event(db, OutboxEvent, event_type: str, payload: Dict[str, Any]):
+    """Agrega un evento al outbox en la transacción en curso; se publica después del commit."""
+    span = current_span()
+    db.add(OutboxEvent(
+        id=uuid.uuid4().hex,
+        type=event_type,
+        payload=payload,
+        traceparent=format_traceparent(span) if span else None,
+    ))
+
+
+# -------- Brokers --------
+class InMemoryBroker:
+    """
+    Stream en memoria con grupos de consumidores, al estilo de Redis Streams.
+
+    Solo comunica tareas del mismo proceso: sirve para pruebas, no para conectar
+    servicios distintos. Como en Redis, guarda a lo sumo `maxlen` eventos y
+    descarta los más viejos; `_base` es la posición del primero que queda.
+    """
+
+    def __init__(self, maxlen: int = EVENT_STREAM_MAXLEN):
+        self._events: List[Dict[str, Any]] = []
+        self._base = 0
+        self._maxlen = maxlen
+        self._offsets: Dict[str, int] = defaultdict(int)
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self._changed = asyncio.Condition()
+
+    async def ensure_group(self, group: str):
+        self._offsets.setdefault(group, 0)
+
+    async def publish(self, events: List[Dict[str, Any]]):
+        async with self._changed:
+            self._events.extend(events)
+            dropped = len(self._events) - self._maxlen
+            if dropped > 0:
+                del self._events[:dropped]
+                self._base += dropped
+            self._changed.notify_all()
+
+    async def read(self, group: str, consumer: str, count: int, block_ms: int, pending: bool = False) -> List[Message]:
+        if pending:
+            return list(self._pending[group].items())[:count]
+        async with self._changed:
+            if self._offsets[group] >= self._base + len(self._events):
+                try:
+                    await asyncio.wait_for(self._changed.wait(), block_ms / 1000)
+                except asyncio.TimeoutError:
+                    return []
+            # Un grupo atrasado pierde los eventos ya descartados, igual que con MAXLEN en Redis
+            start = max(self._offsets[group], self._base)
+            batch = self._events[start - self._base:start - self._base + count]
+            self._offsets[group] = start + len(batch)
+        messages = [(str(start + index), event) for index, event in enumerate(batch)]
+        self._pending[group].update(messages)
+        return messages
+
+    async def ack(self, group: str, message_ids: List[str]):
+        for message_id in message_ids:
+            self._pending[group].pop(message_id, None)
+
+    async def aclose(self):
+        pass
+
+
+class RedisBroker:
+    """Broker sobre Redis Streams: un stream compartido y un grupo de consumidores por servicio."""
+
+    def __init__(self, url: str, stream: str = EVENT_STREAM, maxlen: int = EVENT_STREAM_MAXLEN):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._stream = stream
+        self._maxlen = maxlen
+        # Posición de XAUTOCLAIM por grupo, para recorrer todos los pendientes entre pasadas
+        self._claim_cursors: Dict[str, str] = {}
+
+    async def ensure_group(self, group: str):
+        from redis.exceptions import ResponseError
+
+        try:
+            await self._redis.xgroup_create(self._stream, group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def publish(self, events: List[Dict[str, Any]]):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.xadd(self._stream, {"event": json.dumps(event)}, maxlen=self._maxlen, approximate=True)
+            await pipe.execute()
+
+    async def read(self, group: str, consumer: str, count: int, block_ms: int, pending: bool = False) -> List[Message]:
+        if pending:
+            return await self._claim(group, consumer, count)
+        response = await self._redis.xreadgroup(group, consumer, {self._stream: ">"}, count=count, block=block_ms)
+        return [
+            (message_id, json.loads(fields["event"]))
+            for _, entries in response or []
+            for message_id, fields in entries
+            if fields
+        ]
+
+    async def _claim(self, group: str, consumer: str, count: int) -> List[Message]:
+        """
+        Toma los mensajes del grupo sin confirmar hace más de EVENT_CLAIM_MIN_IDLE_MS.
+
+        XAUTOCLAIM los pasa a este consumidor sin importar a quién se entregaron, así
+        no quedan perdidos los de un consumidor que no vuelve (el nombre es el hostname
+        y cambia con cada contenedor).
+        """
+        cursor = self._claim_cursors.get(group, "0-0")
+        response = await self._redis.xautoclaim(
+            self._stream, group, consumer, min_idle_time=EVENT_CLAIM_MIN_IDLE_MS, start_id=cursor, count=count
+        )
+        self._claim_cursors[group] = response[0]
+        return [(message_id, json.loads(fields["event"])) for message_id, fields in response[1] if fields]
+
+    async def ack(self, group: str, message_ids: List[str]):
+        if message_ids:
+            await self._redis.xack(self._stream, group, *message_ids)
+
+    async def aclose(self):
+        await self._redis.aclose()
+
+
+def create_broker(url: str = EVENT_BROKER_URL):
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBroker(url)
+    if url.startswith("memory://"):
+        if not EVENT_BROKER_ALLOW_MEMORY:
+            raise ValueError("El broker en memoria solo se usa en pruebas (EVENT_BROKER_ALLOW_MEMORY=true)")
+        return InMemoryBroker()
+    raise ValueError(f"Broker de eventos no soportado: {url}")
+
+
+# -------- Relay --------
+async def relay_outbox(broker, session_factory, OutboxEvent, source: str):
+    """
+    Publica en el broker los eventos del outbox, en orden y por lotes.
+
+    La entrega es "al menos una vez": si el proceso cae después de publicar y antes
+    del commit, el lote se vuelve a publicar, por eso los consumidores son idempotentes.
+    """
+    from sqlalchemy import delete, select
+
+    while True:
+        try:
+            async with session_factory() as db:
+                # SKIP LOCKED: otra réplica del relay toma los lotes siguientes
+                rows = (await db.execute(
+                    select(OutboxEvent)
+                    .order_by(OutboxEvent.created_at)
+                    .limit(OUTBOX_BATCH_SIZE)
+                    .with_for_update(skip_locked=True)
+                )).scalars().all()
+                if rows:
+                    await broker.publish([
+                        {
+                            "id": row.id,
+                            "type": row.type,
+                            "source": source,
+                            "occurred_at": row.created_at.isoformat(),
+                            "traceparent": row.traceparent,
+                            "payload": row.payload,
+                        }
+                        for row in rows
+                    ])
+                    for row in rows:
+                        EVENTS_PUBLISHED.inc(type=row.type)
+                    await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([row.id for row in rows])))
+                    await db.commit()
+            if len(rows) == OUTBOX_BATCH_SIZE:
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Error publicando eventos del outbox")
+        await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+# -------- Consumidores --------
+class EventConsumer:
+    """
+    Aplica lotes de eventos con handlers idempotentes.
+
+    Cada evento se registra en `processed_events` dentro de la misma transacción
+    que su efecto; un evento repetido se ignora. Un lote se guarda con un solo
+    commit y, si falla, se reintenta evento por evento para aislar al que falla.
+    """
+
+    def __init__(self, group: str, session_factory, ProcessedEvent, handlers: Dict[str, Handler]):
+        self.group = group
+        self.session_factory = session_factory
+        self.ProcessedEvent = ProcessedEvent
+        self.handlers = handlers
+
+    async def _apply(self, db, event: Dict[str, Any]) -> str:
+        from sqlalchemy.dialects.postgresql import insert
+
+        handler = self.handlers.get(event["type"])
+        if handler is None:
+            return "ignored"
+        inserted = await db.execute(
+            insert(self.ProcessedEvent.__table__)
+            .values(id=event["id"], processed_at=datetime.utcnow())
+            .on_conflict_do_nothing()
+        )
+        if inserted.rowcount == 0:
+            return "duplicate"
+        with start_span(f"event {event['type']}", kind="consumer", parent=parse_traceparent(event.get("traceparent"))):
+            await handler(db, event["payload"])
+        return "applied"
+
+    async def handle_batch(self, messages: List[Message]) -> List[str]:
+        """Aplica los mensajes y devuelve los ids que se pueden confirmar en el broker."""
+        async with self.session_factory() as db:
+            try:
+                results = [await self._apply(db, event) for _, event in messages]
+                await db.commit()
+                for (_, event), result in zip(messages, results):
+                    EVENTS_CONSUMED.inc(group=self.group, type=event["type"], result=result)
+                return [message_id for message_id, _ in messages]
+            except Exception:
+                await db.rollback()
+                if len(messages) == 1:
+                    raise
+
+        done = []
+        for message in messages:
+            try:
+                done.extend(await self.handle_batch([message]))
+            except Exception:
+                EVENTS_CONSUMED.inc(group=self.group, type=message[1]["type"], result="error")
+                logger.exception("Error aplicando el evento %s", message[1]["id"])
+        return done
+
+    async def run(self, broker, consumer: Optional[str] = None):
+        """
+        Lee el stream con el grupo del servicio y aplica los eventos por lotes.
+
+        Al arrancar, y después cada EVENT_CLAIM_MIN_IDLE_MS, se reprocesan los mensajes
+        del grupo que llevan ese tiempo sin confirmar, sean de este consumidor o de otro.
+        """
+        consumer = consumer or socket.gethostname()
+        await broker.ensure_group(self.group)
+        pending = True
+        next_claim = time.monotonic() + EVENT_CLAIM_MIN_IDLE_MS / 1000
+        while True:
+            try:
+                if not pending and time.monotonic() >= next_claim:
+                    pending = True
+                    next_claim = time.monotonic() + EVENT_CLAIM_MIN_IDLE_MS / 1000
+                messages = await broker.read(self.group, consumer, EVENT_CONSUMER_BATCH, EVENT_CONSUMER_BLOCK_MS, pending=pending)
+                done = await self.handle_batch(messages) if messages else []
+                await broker.ack(self.group, done)
+                # Los pendientes se releen hasta agotarlos o hasta que solo queden los que fallan
+                if pending and (len(messages) < EVENT_CONSUMER_BATCH or not done):
+                    pending = False
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error consumiendo eventos del grupo %s", self.group)
+                await asyncio.sleep(1)
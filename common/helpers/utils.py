@@ -3,8 +3,8 @@ import logging
 from typing import Any, Dict, Optional
 from datetime import datetime
 from common.config import settings
+from common.tracing import inject_headers, start_span
 from email_validator import validate_email as ev_validate, EmailNotValidError
-from common.helpers.utils import send_request_to_service, build_service_url, validate_email
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
@@ -32,10 +32,12 @@ async def send_request_to_service(
         httpx.RequestError: Si la petición falla.
     """
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            resp = await client.request(method, url, json=data, headers=headers)
-            resp.raise_for_status()
-            return resp.json()
+        with start_span(f"HTTP {method}", kind="client", **{"http.url": url}) as span:
+            async with httpx.AsyncClient(timeout=20.0) as client:
+                resp = await client.request(method, url, json=data, headers=inject_headers(headers))
+                span.attributes["http.status_code"] = resp.status_code
+                resp.raise_for_status()
+                return resp.json()
     except httpx.RequestError as e:
         logger.error(f"[ERROR] Petición fallida a {url}: {e}")
         raise
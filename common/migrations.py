@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import logging
+import sys
+from dataclasses import dataclass
+from typing import Callable, List
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select, text
+
+from common.database import async_url, wait_for_database
+
+# Clave del advisory lock de Postgres: dos corridas simultáneas no aplican la misma migración
+MIGRATIONS_LOCK_ID = 4_170_251
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, server_default=func.now(), nullable=False),
+)
+
+
+@dataclass
+class Migration:
+    """
+    Un paso versionado del esquema.
+
+    `apply` recibe una conexión síncrona de SQLAlchemy (se corre con `run_sync`)
+    dentro de una transacción propia. Las versiones no se reescriben una vez
+    publicadas: los cambios nuevos van en una versión nueva.
+    """
+    version: int
+    description: str
+    apply: Callable
+
+
+def latest_version(migrations: List[Migration]) -> int:
+    return max((migration.version for migration in migrations), default=0)
+
+
+async def schema_version(conn) -> int:
+    """Última versión aplicada; 0 si la base todavía no tiene la tabla de migraciones."""
+    if await conn.scalar(text("SELECT to_regclass('schema_migrations')")) is None:
+        return 0
+    return await conn.scalar(select(func.coalesce(func.max(schema_migrations.c.version), 0)))
+
+
+async def migrate(engine, migrations: List[Migration]) -> List[int]:
+    """Aplica en orden las migraciones pendientes y devuelve las versiones aplicadas."""
+    applied = []
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+        await conn.commit()
+        try:
+            async with conn.begin():
+                await conn.run_sync(metadata.create_all)
+                current = await schema_version(conn)
+            for migration in sorted(migrations, key=lambda migration: migration.version):
+                if migration.version <= current:
+                    continue
+                logger.info("Aplicando migración %d: %s", migration.version, migration.description)
+                async with conn.begin():
+                    await conn.run_sync(migration.apply)
+                    await conn.execute(
+                        schema_migrations.insert().values(version=migration.version, description=migration.description)
+                    )
+                applied.append(migration.version)
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+            await conn.commit()
+    return applied
+
+
+async def database_ready(engine, required_version: int) -> bool:
+    """Hay conexión desde el pool y el esquema ya está en la versión que espera el código."""
+    async with engine.connect() as conn:
+        return await schema_version(conn) >= required_version
+
+
+def run_cli(database_url: str, migrations: List[Migration], description: str):
+    """Punto de entrada de los scripts `migrations.py` de cada servicio."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="solo informa si hay migraciones pendientes (código 1 si las hay)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def main() -> int:
+        engine = create_async_engine(async_url(database_url))
+        try:
+            if args.check:
+                async with engine.connect() as conn:
+                    current = await schema_version(conn)
+                print(f"Versión del esquema: {current} (última: {latest_version(migrations)})")
+                return 0 if current >= latest_version(migrations) else 1
+            await wait_for_database(engine)
+            applied = await migrate(engine, migrations)
+            print(f"Migraciones aplicadas: {applied or 'ninguna'}")
+            return 0
+        finally:
+            await engine.dispose()
+
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from common.bloom import BloomFilter
+from common.metrics import registry
+
+# Cada cuánto se traen las revocaciones nuevas y cada cuánto se rearma el filtro completo
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))
+REVOCATION_REBUILD_INTERVAL = float(os.getenv("REVOCATION_REBUILD_INTERVAL", "300"))
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", "100000"))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", "0.001"))
+# Cuánto se recuerda la respuesta exacta del servicio de autenticación para un jti sospechoso
+REVOCATION_CONFIRM_TTL = float(os.getenv("REVOCATION_CONFIRM_TTL", "30"))
+
+logger = logging.getLogger(__name__)
+
+# fetch(ruta, query params) -> respuesta del servicio de autenticación
+Fetch = Callable[[str, Optional[Dict[str, Any]]], Awaitable[Any]]
+# load(cursor o None para la lista completa) -> (cursor para la próxima consulta, jtis revocados)
+Load = Callable[[Optional[str]], Awaitable[Tuple[str, List[str]]]]
+# confirm(jti) -> si está revocado, según la lista exacta
+Confirm = Callable[[str], Awaitable[bool]]
+
+REVOCATION_CHECKS = registry.counter(
+    "auth_revocation_checks_total", "Verificaciones de tokens revocados", ("result",)
+)
+REVOCATION_FILTER_SIZE = registry.gauge(
+    "auth_revocation_filter_items", "jtis cargados en el filtro de revocaciones"
+)
+
+
+class RevocationFilter:
+    """
+    Lista de `jti` revocados mantenida como filtro de Bloom en memoria.
+
+    Casi todos los tokens no están revocados y se descartan con una consulta al
+    filtro, sin red ni base de datos. Solo si el filtro da positivo se consulta la
+    lista exacta (el servicio de autenticación o su base). El filtro se completa
+    cada pocos segundos con las revocaciones nuevas y se rearma de cero cada
+    tanto, así los tokens ya vencidos dejan de ocupar lugar. Hasta la primera
+    sincronización el filtro está vacío: todos los tokens se consultan.
+    """
+
+    def __init__(self, capacity: int = REVOCATION_FILTER_CAPACITY, error_rate: float = REVOCATION_FILTER_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.cursor: Optional[str] = None
+        self.synced_at = 0.0
+        self._confirmed: Dict[str, tuple] = {}
+
+    @property
+    def synced(self) -> bool:
+        return self.synced_at > 0
+
+    def might_be_revoked(self, jti: str) -> bool:
+        return jti in self.bloom
+
+    def add(self, jti: str):
+        """Revocación hecha en este mismo proceso: vale ya, sin esperar a la próxima sincronización."""
+        self.bloom.add(jti)
+        self._confirmed.pop(jti, None)
+
+    async def is_revoked(self, jti: str, confirm: Confirm) -> bool:
+        if self.synced and not self.might_be_revoked(jti):
+            REVOCATION_CHECKS.inc(result="filter_miss")
+            return False
+        cached = self._confirmed.get(jti)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        try:
+            revoked = await confirm(jti)
+        except Exception:
+            # Sin confirmación se asume revocado: solo afecta a los positivos del filtro (y a todos antes de sincronizar)
+            logger.exception("No se pudo confirmar la revocación de %s", jti)
+            return True
+        REVOCATION_CHECKS.inc(result="revoked" if revoked else "false_positive")
+        if len(self._confirmed) > 10000:
+            self._confirmed.clear()
+        self._confirmed[jti] = (revoked, time.monotonic() + REVOCATION_CONFIRM_TTL)
+        return revoked
+
+    async def sync(self, load: Load, full: bool = False):
+        since = None if full or self.cursor is None else self.cursor
+        cursor, jtis = await load(since)
+        if since is None:
+            # Se arma aparte y se reemplaza de una vez para no dejar huecos mientras se carga
+            capacity = max(self.capacity, 2 * len(jtis))
+            self.bloom = BloomFilter.from_items(jtis, capacity, self.error_rate)
+            self._confirmed.clear()
+        else:
+            for jti in jtis:
+                self.bloom.add(jti)
+        self.cursor = cursor
+        self.synced_at = time.monotonic()
+        REVOCATION_FILTER_SIZE.set(len(self.bloom))
+
+    async def run(self, load: Load, interval: float = REVOCATION_SYNC_INTERVAL, rebuild_interval: float = REVOCATION_REBUILD_INTERVAL):
+        """Mantiene el filtro al día hasta que se cancele la tarea."""
+        last_rebuild = 0.0
+        while True:
+            try:
+                full = time.monotonic() - last_rebuild >= rebuild_interval
+                await self.sync(load, full=full)
+                if full:
+                    last_rebuild = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error sincronizando las revocaciones de tokens")
+            await asyncio.sleep(interval)
+
+
+# -------- Lista exacta en el servicio de autenticación, vista por HTTP (API Gateway) --------
+def fetch_loader(fetch: Fetch) -> Load:
+    async def load(since: Optional[str]) -> Tuple[str, List[str]]:
+        response = await fetch("/revocations", None if since is None else {"since": since})
+        response.raise_for_status()
+        data = response.json()
+        return data["now"], data["jtis"]
+    return load
+
+
+def fetch_confirmer(fetch: Fetch) -> Confirm:
+    async def confirm(jti: str) -> bool:
+        response = await fetch(f"/revocations/{jti}", None)
+        return response.status_code != 404
+    return confirm
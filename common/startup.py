@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Any, Awaitable, Callable
+
+# Conexión inicial a la base: intentos y espera exponencial entre ellos (segundos)
+STARTUP_CONNECT_ATTEMPTS = int(os.getenv("STARTUP_CONNECT_ATTEMPTS", "10"))
+STARTUP_BACKOFF_INITIAL = float(os.getenv("STARTUP_BACKOFF_INITIAL", "0.1"))
+STARTUP_BACKOFF_MAX = float(os.getenv("STARTUP_BACKOFF_MAX", "5"))
+# Tiempo máximo de la verificación de /ready
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "1"))
+
+logger = logging.getLogger(__name__)
+
+
+async def connect_with_retry(
+    connect: Callable[[], Awaitable[Any]],
+    name: str,
+    attempts: int = STARTUP_CONNECT_ATTEMPTS,
+    initial: float = STARTUP_BACKOFF_INITIAL,
+    maximum: float = STARTUP_BACKOFF_MAX,
+):
+    """
+    Ejecuta `connect` hasta que funcione, esperando cada vez el doble (con jitter).
+
+    Si la base ya está arriba no hay espera. Tras `attempts` fallos se propaga el
+    último error y el proceso no termina de arrancar, así el orquestador lo reinicia.
+    """
+    delay = initial
+    for attempt in range(1, attempts + 1):
+        try:
+            return await connect()
+        except Exception as e:
+            if attempt == attempts:
+                logger.error("No se pudo conectar a %s tras %d intentos", name, attempts)
+                raise
+            logger.warning("%s no disponible (intento %d/%d): %s", name, attempt, attempts, e)
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, maximum)
+
+
+async def check_ready(check: Callable[[], Awaitable[bool]], timeout: float = READY_CHECK_TIMEOUT) -> bool:
+    """Corre la verificación de disponibilidad con un tiempo máximo; cualquier error cuenta como no listo."""
+    try:
+        return bool(await asyncio.wait_for(check(), timeout))
+    except Exception:
+        return False
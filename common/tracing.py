@@ -0,0 +1,280 @@
+import atexit
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Query
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+# Spans guardados en memoria por proceso y, opcionalmente, en un archivo JSON lines
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# Cada cuántos segundos se escriben al archivo los spans acumulados
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "1"))
+
+# Propagación según W3C Trace Context
+TRACEPARENT_HEADER = "traceparent"
+TRACE_ID_HEADER = "x-trace-id"
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    service: str
+    kind: str
+    start: float
+    end: Optional[float] = None
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end is None:
+            return None
+        return round((self.end - self.start) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["duration_ms"] = self.duration_ms
+        return data
+
+
+class Collector:
+    """
+    Colector local de spans: los últimos N en memoria y, si se configura, un archivo JSON lines.
+
+    `add` se llama desde el event loop, así que no toca el disco: los spans se
+    acumulan y un hilo aparte los escribe cada TRACE_FLUSH_INTERVAL segundos. Si el
+    disco no da abasto se descartan los más viejos en lugar de crecer sin límite.
+    """
+
+    def __init__(self, max_spans: int, path: str = ""):
+        self._spans: deque = deque(maxlen=max_spans)
+        self._path = path
+        self._lock = threading.Lock()
+        self._unwritten: deque = deque(maxlen=max_spans)
+        self._writer: Optional[threading.Thread] = None
+
+    def add(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+            if self._path:
+                self._unwritten.append(span)
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+
+    def _write_loop(self):
+        while True:
+            time.sleep(TRACE_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def flush(self):
+        with self._lock:
+            spans = list(self._unwritten)
+            self._unwritten.clear()
+        if spans:
+            with open(self._path, "a", encoding="utf-8") as file:
+                file.write("".join(json.dumps(span.to_dict()) + "\n" for span in spans))
+
+    def trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = [span for span in self._spans if span.trace_id == trace_id]
+        return [span.to_dict() for span in sorted(spans, key=lambda span: span.start)]
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        """Resumen de las últimas trazas vistas por este proceso, de la más nueva a la más vieja."""
+        with self._lock:
+            spans = list(self._spans)
+        traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for span in reversed(spans):
+            summary = traces.setdefault(span.trace_id, {"trace_id": span.trace_id, "spans": 0, "root": None, "duration_ms": None})
+            summary["spans"] += 1
+            if span.kind == "server" and summary["root"] is None:
+                summary["root"] = span.name
+                summary["duration_ms"] = span.duration_ms
+        return list(traces.values())[:limit]
+
+
+collector = Collector(TRACE_BUFFER_SIZE, TRACE_FILE)
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_service_name = "unknown"
+
+
+def new_id(size: int) -> str:
+    return secrets.token_hex(size)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Devuelve (trace_id, span_id del padre) de un header `traceparent`, o None si no es válido."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def format_traceparent(span: Span) -> str:
+    return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+def begin_span(name: str, kind: str = "internal", parent: Optional[Tuple[str, str]] = None, **attributes) -> Span:
+    """
+    Crea un span hijo del span actual (o del padre remoto indicado) sin volverlo el actual.
+
+    Útil para operaciones hoja como consultas SQL; se cierra con `end_span`.
+    """
+    if parent is None:
+        current = current_span()
+        parent = (current.trace_id, current.span_id) if current else None
+    trace_id, parent_id = parent if parent else (new_id(16), None)
+    return Span(trace_id, new_id(8), parent_id, name, _service_name, kind, time.time(), attributes=attributes)
+
+
+def end_span(span: Span, error: Optional[BaseException] = None):
+    span.end = time.time()
+    if error is not None:
+        span.status = "error"
+        span.attributes["error"] = repr(error)
+    collector.add(span)
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", parent: Optional[Tuple[str, str]] = None, **attributes):
+    """Span que pasa a ser el actual mientras dura el bloque `with`."""
+    span = begin_span(name, kind, parent, **attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        end_span(span, e)
+        raise
+    else:
+        end_span(span)
+    finally:
+        _current_span.reset(token)
+
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Agrega el `traceparent` del span actual a los headers de una petición saliente."""
+    headers = dict(headers or {})
+    span = current_span()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = format_traceparent(span)
+    return headers
+
+
+class TracingMiddleware:
+    """Middleware ASGI que abre un span de servidor por petición, continuando la traza entrante."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        parent = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+
+        with start_span(f"{scope['method']} {scope['path']}", kind="server", parent=parent) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.attributes["http.status_code"] = message["status"]
+                    message["headers"] = list(message.get("headers", [])) + [(TRACE_ID_HEADER.encode(), span.trace_id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            route = scope.get("route")
+            if route is not None:
+                span.name = f"{scope['method']} {route.path}"
+
+
+def traces_endpoint(limit: int = Query(50, ge=1, le=TRACE_BUFFER_SIZE)) -> JSONResponse:
+    return JSONResponse(collector.recent(limit))
+
+
+def trace_endpoint(request: Request) -> JSONResponse:
+    return JSONResponse(collector.trace(request.path_params["trace_id"]))
+
+
+def instrument_tracing(app, service: str):
+    """Traza las peticiones de una app FastAPI y expone `/traces` y `/traces/{trace_id}`."""
+    global _service_name
+    _service_name = service
+    app.add_middleware(TracingMiddleware)
+    app.add_api_route("/traces", traces_endpoint, methods=["GET"], include_in_schema=False)
+    app.add_route("/traces/{trace_id}", trace_endpoint, methods=["GET"], include_in_schema=False)
+
+
+# -------- SQLAlchemy --------
+def trace_engine(engine):
+    """Crea un span hijo por cada consulta SQL ejecutada con el engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        span = begin_span(f"SQL {operation}", kind="client", **{"db.statement": statement[:500]})
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        end_span(conn.info["trace_spans"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("trace_spans"):
+            end_span(context.connection.info["trace_spans"].pop(), context.original_exception)
+
+
+# -------- MongoDB --------
+def tracing_command_listener():
+    """Listener de pymongo que crea un span hijo por comando; se pasa en `event_listeners`."""
+    from pymongo import monitoring
+
+    class CommandTracing(monitoring.CommandListener):
+        def __init__(self):
+            self._spans: Dict[Any, Span] = {}
+            self._lock = threading.Lock()
+
+        def started(self, event):
+            span = begin_span(f"MongoDB {event.command_name}", kind="client", **{"db.collection": event.command.get(event.command_name)})
+            with self._lock:
+                self._spans[(event.request_id, event.operation_id)] = span
+
+        def _finish(self, event, error=None):
+            with self._lock:
+                span = self._spans.pop((event.request_id, event.operation_id), None)
+            if span is not None:
+                end_span(span, error)
+
+        def succeeded(self, event):
+            self._finish(event)
+
+        def failed(self, event):
+            self._finish(event, Exception(str(event.failure)))
+
+    return CommandTracing()
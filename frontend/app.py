@@ -1,4 +1,5 @@
 import os
+import time
 import requests
 from fastapi import FastAPI, Request, Form, Response, UploadFile, File
 from fastapi.responses import RedirectResponse, HTMLResponse
@@ -6,15 +7,45 @@ from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
+from common.metrics import instrument_app
+from common.tracing import inject_headers, instrument_tracing
+
 API_GATEWAY_URL = os.getenv("API_GATEWAY_URL", "http://api-gateway:8000")
 FRONT_SECRET_KEY = os.getenv("FRONT_SECRET_KEY", "frontend_secret_key")
 
 app = FastAPI()
 app.add_middleware(SessionMiddleware, secret_key=FRONT_SECRET_KEY)
+instrument_app(app, "frontend")
+instrument_tracing(app, "frontend")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+
+def store_tokens(request: Request, tokens: dict):
+    request.session["token"] = tokens["access_token"]
+    request.session["refresh_token"] = tokens.get("refresh_token")
+    request.session["token_expires_at"] = time.time() + (tokens.get("expires_in") or 0)
+
+
+def auth_headers(request: Request) -> dict:
+    """Headers con el access token de la sesión, renovándolo si está por vencer."""
+    refresh_token = request.session.get("refresh_token")
+    if refresh_token and request.session.get("token_expires_at", 0) - 30 < time.time():
+        try:
+            response = requests.post(
+                f"{API_GATEWAY_URL}/auth/refresh",
+                json={"refresh_token": refresh_token},
+                headers=inject_headers(),
+                timeout=5
+            )
+            if response.status_code == 200:
+                store_tokens(request, response.json())
+        except requests.RequestException:
+            pass
+    token = request.session.get("token")
+    return inject_headers({"Authorization": f"Bearer {token}"} if token else {})
+
 @app.get("/", response_class=HTMLResponse)
 def index(request: Request):
     if not request.session.get("email"):
@@ -31,18 +62,20 @@ def login_post(request: Request, email: str = Form(...), password: str = Form(..
         response = requests.post(
             f"{API_GATEWAY_URL}/auth/login",
             data={"username": email, "password": password},
+            headers=inject_headers(),
             timeout=5
         )
         if response.status_code == 200:
-            token = response.json()["access_token"]
+            tokens = response.json()
+            token = tokens["access_token"]
             userinfo = requests.get(
                 f"{API_GATEWAY_URL}/auth/users/me",
-                headers={"Authorization": f"Bearer {token}"},
+                headers=inject_headers({"Authorization": f"Bearer {token}"}),
                 timeout=5
             )
             if userinfo.status_code == 200:
                 user_data = userinfo.json()
-                request.session["token"] = token
+                store_tokens(request, tokens)
                 request.session["email"] = email
                 request.session["role"] = user_data.get("role")
                 return RedirectResponse("/", status_code=303)
@@ -67,6 +100,17 @@ def login_post(request: Request, email: str = Form(...), password: str = Form(..
 
 @app.get("/logout")
 def logout(request: Request):
+    # Revoca el access token y la sesión de refresh en el servicio de autenticación
+    if request.session.get("token"):
+        try:
+            requests.post(
+                f"{API_GATEWAY_URL}/auth/logout",
+                json={"refresh_token": request.session.get("refresh_token")},
+                headers=auth_headers(request),
+                timeout=5
+            )
+        except requests.RequestException:
+            pass
     request.session.clear()
     return RedirectResponse("/", status_code=303)
 
@@ -86,6 +130,7 @@ def register_post(
         response = requests.post(
             f"{API_GATEWAY_URL}/auth/register",
             json={"email": email, "password": password, "full_name": full_name, "role": role},
+            headers=inject_headers(),
             timeout=5
         )
         if response.status_code == 200:
@@ -104,17 +149,21 @@ def register_post(
         )
 
 @app.get("/products", response_class=HTMLResponse)
-def products(request: Request):
-    token = request.session.get("token")
-    headers = {"Authorization": f"Bearer {token}"} if token else {}
+def products(request: Request, cursor: str = None, q: str = None):
+    if q:
+        url, params = f"{API_GATEWAY_URL}/products/products/search", {"q": q}
+    else:
+        url, params = f"{API_GATEWAY_URL}/products/products/", ({"cursor": cursor} if cursor else {})
     try:
-        response = requests.get(f"{API_GATEWAY_URL}/products/", headers=headers, timeout=5)
+        response = requests.get(url, params=params, headers=auth_headers(request), timeout=5)
         if response.status_code == 200:
             products = response.json()
             return templates.TemplateResponse("products.html", {
                 "request": request, 
                 "session": request.session, 
-                "products": products})
+                "products": products,
+                "q": q,
+                "next_cursor": response.headers.get("X-Next-Cursor")})
         else:
             return templates.TemplateResponse(
                 "products.html",
@@ -155,7 +204,7 @@ def add_product_post(
         image_url = f"/static/uploads/{image.filename}"
     try:
         response = requests.post(
-            f"{API_GATEWAY_URL}/products/",
+            f"{API_GATEWAY_URL}/products/products/",
             json={
                 "name": name,
                 "description": description,
@@ -163,9 +212,10 @@ def add_product_post(
                 "stock": stock,
                 "image": image_url
             },
+            headers=auth_headers(request),
             timeout=5
         )
-        if response.status_code == 200:
+        if response.status_code == 201:
             return templates.TemplateResponse(
                 "add_product.html",
                 {"request": request, "success": "Producto agregado correctamente"}
@@ -251,26 +301,65 @@ def orders(request: Request):
     })
 
 @app.get("/my-products", response_class=HTMLResponse)
-def my_products(request: Request):
+def my_products(request: Request, cursor: str = None):
     if not request.session.get("email") or request.session.get("role") != "vendedor":
         return RedirectResponse("/")
-    products = [
-        {"id": 1, "name": "Vasija artesanal", "price": 12000, "description": "Hecha a mano", "stock": 5, "image": None},
-        {"id": 2, "name": "Collar tejido", "price": 8000, "description": "Colores vivos", "stock": 10, "image": None}
-    ]
+    try:
+        # Productos publicados por el usuario de la sesión (lo identifica el gateway por el token)
+        response = requests.get(
+            f"{API_GATEWAY_URL}/products/products/mine",
+            params={"cursor": cursor} if cursor else {},
+            headers=auth_headers(request),
+            timeout=5
+        )
+        response.raise_for_status()
+        products = response.json()
+    except (requests.RequestException, ValueError):
+        return templates.TemplateResponse("my_products.html", {
+            "request": request,
+            "session": request.session,
+            "products": [],
+            "error": "No se pudieron obtener tus productos"
+        })
     return templates.TemplateResponse("my_products.html", {
         "request": request,
         "session": request.session,
-        "products": products
+        "products": products,
+        "next_cursor": response.headers.get("X-Next-Cursor")
     })
 
 @app.get("/received-orders", response_class=HTMLResponse)
 def received_orders(request: Request):
     if not request.session.get("email") or request.session.get("role") != "vendedor":
         return RedirectResponse("/")
+    try:
+        # El gateway une las órdenes con los perfiles de sus clientes en una sola respuesta.
+        # Sin product_ids, órdenes trae las de todos los productos del vendedor y solo sus ítems.
+        response = requests.get(
+            f"{API_GATEWAY_URL}/composite/orders/by-product",
+            headers=auth_headers(request),
+            timeout=5
+        )
+        response.raise_for_status()
+        received = response.json()["orders"]
+    except (requests.RequestException, ValueError):
+        return templates.TemplateResponse("received_orders.html", {
+            "request": request,
+            "session": request.session,
+            "orders": [],
+            "error": "No se pudieron obtener los pedidos"
+        })
+
     orders = [
-        {"id": 1, "client_email": "cliente1@email.com", "status": "Pagado", "total": 12000},
-        {"id": 2, "client_email": "cliente2@email.com", "status": "Pendiente", "total": 8000}
+        {
+            "id": order["id"],
+            "client_email": order["user_email"],
+            "client_name": (order["client"] or {}).get("full_name"),
+            "status": order["status"],
+            # Precio de cada ítem al crear la orden; los ítems sin precio registrado no suman
+            "total": sum(item["price"] * item["quantity"] for item in order["items"] if item.get("price") is not None),
+        }
+        for order in received
     ]
     return templates.TemplateResponse("received_orders.html", {
         "request": request,
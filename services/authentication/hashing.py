@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from common.metrics import registry
+
+# Procesos dedicados a bcrypt y cuántas operaciones pueden esperar turno antes de rechazar
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or os.cpu_count() or 1
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "0")) or PASSWORD_HASH_WORKERS * 8
+# Costo de bcrypt, fijo por configuración para que todas las réplicas usen el mismo.
+# Se elige una vez por hardware con `python hashing.py --calibrate`; nunca baja de BCRYPT_MIN_ROUNDS.
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "12"))
+BCRYPT_ROUNDS = max(int(os.getenv("BCRYPT_ROUNDS", "12")), BCRYPT_MIN_ROUNDS)
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MAX_ROUNDS = 16
+
+HASH_PENDING = registry.gauge(
+    "auth_password_hash_pending", "Operaciones de bcrypt en cola o en curso"
+)
+HASH_REJECTED = registry.counter(
+    "auth_password_hash_rejected_total", "Operaciones de bcrypt rechazadas por cola llena", ("operation",)
+)
+HASH_LATENCY = registry.histogram(
+    "auth_password_hash_duration_seconds", "Tiempo de bcrypt incluida la espera en cola", ("operation",)
+)
+HASH_ROUNDS = registry.gauge(
+    "auth_bcrypt_rounds", "Costo de bcrypt usado para los hashes nuevos"
+)
+
+
+# -------- Funciones que corren en los procesos del pool --------
+@lru_cache(maxsize=None)
+def crypt_context(rounds: int) -> CryptContext:
+    # min_rounds hace que needs_update marque los hashes con un costo menor al actual
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+
+
+def _hash(password: str, rounds: int) -> str:
+    return crypt_context(rounds).hash(password)
+
+
+def _verify(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    """Devuelve (coincide, hash nuevo si el guardado usa un costo desactualizado)."""
+    context = crypt_context(rounds)
+    if not context.verify(password, hashed_password):
+        return False, None
+    if context.needs_update(hashed_password):
+        return True, context.hash(password)
+    return True, None
+
+
+def _warm_up(rounds: int):
+    crypt_context(rounds)
+
+
+def _calibrate(target_ms: float, min_rounds: int) -> int:
+    """Mayor costo cuyo hash tarda a lo sumo `target_ms` en este hardware (y nunca menos de `min_rounds`)."""
+    rounds = min_rounds
+    while rounds < BCRYPT_MAX_ROUNDS:
+        started = time.perf_counter()
+        _hash("calibracion", rounds)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # Cada punto de costo duplica el tiempo
+        if elapsed_ms * 2 > target_ms:
+            break
+        rounds += 1
+    return rounds
+
+
+# -------- Lado del servicio --------
+class PasswordHasher:
+    """
+    Ejecuta bcrypt en un pool de procesos para no frenar al servidor.
+
+    bcrypt retiene el GIL mientras calcula; en el threadpool una ráfaga de logins
+    demoraba a todos los demás endpoints. Con procesos aparte, el throughput de
+    login escala con los núcleos y el event loop queda libre. Si la cola supera
+    el máximo, se responde 503 en lugar de acumular esperas.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = BCRYPT_ROUNDS
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def start(self):
+        # spawn: no se hereda el estado del proceso padre (hilos del cliente de Mongo, sockets)
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        HASH_ROUNDS.set(self.rounds)
+        # Arranca todos los procesos ahora y no con el primer login
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _warm_up, self.rounds) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, operation: str, fn, *args):
+        if self.pending >= self.max_pending:
+            HASH_REJECTED.inc(operation=operation)
+            raise HTTPException(
+                status_code=503,
+                detail="Servicio de autenticación saturado, intente nuevamente",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        HASH_PENDING.inc()
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self.pending -= 1
+            HASH_PENDING.dec()
+            HASH_LATENCY.observe(time.perf_counter() - started, operation=operation)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run("verify", _verify, password, hashed_password, self.rounds)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calibra el costo de bcrypt en este hardware. Correrlo en una máquina como las de "
+        "producción y fijar el resultado en BCRYPT_ROUNDS.",
+    )
+    parser.add_argument("--target-ms", type=float, default=BCRYPT_TARGET_MS, help="tiempo máximo por hash")
+    args = parser.parse_args()
+    rounds = _calibrate(args.target_ms, BCRYPT_MIN_ROUNDS)
+    print(f"BCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == "__main__":
+    main()
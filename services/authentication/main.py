@@ -1,28 +1,112 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr, constr
-from passlib.context import CryptContext
 from jose import JWTError, jwt
-from pymongo import MongoClient, errors
+from contextlib import asynccontextmanager
+from pymongo import AsyncMongoClient, errors
+from bson import ObjectId
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Literal, Optional, Tuple
+import asyncio
+import logging
+import os
 
 
 # Configuración común
 from common.config import settings
+from hashing import PasswordHasher
+from profiles import PROFILE_FIELDS, ProfileCache, to_profile
+from migrations import database_ready
+from tokens import (
+    is_access_token_revoked,
+    issue_refresh_token,
+    list_revocations,
+    new_jti,
+    revoke_access_token,
+    revoke_refresh_token,
+    use_refresh_token,
+)
+from common.metrics import instrument_app, mongo_command_listener
+from common.revocation import RevocationFilter
+from common.startup import check_ready, connect_with_retry
+from common.tracing import instrument_tracing, tracing_command_listener
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
+# Los access tokens duran poco; la sesión se mantiene renovándolos con refresh tokens rotativos
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 
-# Conexión MongoDB
-client = MongoClient(settings.MONGODB_URL)
-db = client[settings.MONGODB_DB]
+# Pool de conexiones a MongoDB
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Conexión MongoDB (cliente asíncrono: las consultas no ocupan hilos del servidor).
+# Se crea en el lifespan, así importar el módulo no abre conexiones.
+client: Optional[AsyncMongoClient] = None
+db = None
+
+# Campos que se leen de cada usuario; el resto del documento no viaja por la red
+USER_FIELDS = {"_id": 0, "email": 1, "full_name": 1, "role": 1}
+USER_WITH_PASSWORD_FIELDS = {**USER_FIELDS, "hashed_password": 1}
+
+# Consulta de varios usuarios a la vez y cache de sus perfiles públicos (solo para estos roles)
+USERS_BATCH_ROLES = {"admin", "vendedor"}
+USERS_BATCH_MAX = int(os.getenv("USERS_BATCH_MAX", "200"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "20000"))
+
+profile_cache = ProfileCache(PROFILE_CACHE_MAX_ENTRIES, PROFILE_CACHE_TTL)
+
+logger = logging.getLogger(__name__)
+
+# bcrypt corre en un pool de procesos aparte (ver hashing.py)
+password_hasher = PasswordHasher()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
+
+# Mismo filtro de revocaciones que el API Gateway, cargado directo desde Mongo:
+# /users/me solo consulta la base cuando el filtro da positivo
+revocations = RevocationFilter()
+
+
+async def load_revocations(since: Optional[str]) -> Tuple[str, List[str]]:
+    now, jtis = await list_revocations(db, datetime.fromisoformat(since) if since else None)
+    return now.isoformat(), jtis
+
 
-app = FastAPI()
+async def confirm_revocation(jti: str) -> bool:
+    return await is_access_token_revoked(db, jti)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db
+    client = AsyncMongoClient(
+        settings.MONGODB_URL,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        event_listeners=[mongo_command_listener(), tracing_command_listener()],
+    )
+    db = client[settings.MONGODB_DB]
+    # Los índices los crean las migraciones (python migrations.py), no cada arranque
+    await connect_with_retry(lambda: client.admin.command("ping"), "MongoDB")
+    await password_hasher.start()
+    sync = asyncio.create_task(revocations.run(load_revocations))
+    try:
+        yield
+    finally:
+        sync.cancel()
+        await asyncio.gather(sync, return_exceptions=True)
+        password_hasher.shutdown()
+        await client.close()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument_app(app, "auth")
+instrument_tracing(app, "auth")
 
 # Modelos
 class User(BaseModel):
@@ -37,35 +121,91 @@ class UserRegister(BaseModel):
     email: EmailStr
     password: str
     full_name: str
-    role: str
+    # El rol admin no se puede pedir al registrarse: se asigna directamente en la base
+    role: Literal["cliente", "vendedor"]
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # segundos de validez del access token
 
-# Utilidades
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
+class PublicUser(BaseModel):
+    id: str
+    email: EmailStr
+    full_name: Optional[str] = None
+    role: Optional[str] = None
+
+class UserBatchRequest(BaseModel):
+    emails: List[str] = []
+    ids: List[str] = []
+
+class Revocations(BaseModel):
+    now: datetime
+    jtis: List[str]
+
+# Utilidades
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    expire = now + (expires_delta or timedelta(minutes=15))
+    # jti identifica al token para poder revocarlo antes de que venza
+    to_encode.update({"exp": expire, "iat": now, "jti": new_jti()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_user(email: str):
-    user = db.users.find_one({"email": email})
+async def issue_tokens(user: User, family: Optional[str] = None) -> dict:
+    expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(data={"sub": user.email, "role": user.role}, expires_delta=expires_delta)
+    refresh_token = await issue_refresh_token(db, user.email, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), family)
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": int(expires_delta.total_seconds()),
+    }
+
+def decode_access_token(token: str) -> dict:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="No se pudo validar las credenciales",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return payload
+
+async def get_user(email: str):
+    user = await db.users.find_one({"email": email}, USER_FIELDS)
+    if user:
+        return User(**user)
+    return None
+
+async def get_user_with_password(email: str):
+    user = await db.users.find_one({"email": email}, USER_WITH_PASSWORD_FIELDS)
     if user:
         return UserInDB(**user)
     return None
 
-def authenticate_user(email: str, password: str):
-    user = get_user(email)
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(email: str, password: str):
+    user = await get_user_with_password(email)
+    if not user:
+        return False
+    valid, new_hash = await password_hasher.verify(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # El hash guardado usa un costo menor al actual: se reemplaza ahora que se conoce la contraseña
+        await db.users.update_one({"email": email}, {"$set": {"hashed_password": new_hash}})
     return user
 
 # Endpoints
@@ -77,44 +217,130 @@ def root():
 def health():
     return {"status": "ok", "service": "auth-service"}
 
+# A diferencia de /health, verifica que Mongo responda, que los índices estén migrados
+# y que el filtro de revocaciones ya se haya cargado
+@app.get("/ready")
+async def ready():
+    if client is None or not revocations.synced or not await check_ready(lambda: database_ready(client, db)):
+        raise HTTPException(status_code=503, detail="El servicio todavía no puede atender")
+    return {"status": "ready", "service": "auth-service"}
+
 @app.post("/register", response_model=User)
-def register(user: UserRegister):
-    if db.users.find_one({"email": user.email}):
-        raise HTTPException(status_code=400, detail="Email ya registrado")
-    hashed_password = get_password_hash(user.password)
+async def register(user: UserRegister):
+    hashed_password = await password_hasher.hash(user.password)
     user_dict = user.dict()
     user_dict["hashed_password"] = hashed_password
     del user_dict["password"]
-    db.users.insert_one(user_dict)
+    # Un solo insert: el índice único resuelve los registros simultáneos del mismo email
+    try:
+        await db.users.insert_one(user_dict)
+    except errors.DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email ya registrado")
     return User(**user_dict)
 
 @app.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales incorrectas",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.email}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    return {"access_token": access_token, "token_type": "bearer"}
+    return await issue_tokens(user)
+
+# Canjear un refresh token por un par nuevo (el anterior deja de servir)
+@app.post("/refresh", response_model=Token)
+async def refresh(request: RefreshRequest):
+    document, reason = await use_refresh_token(db, request.refresh_token)
+    user = await get_user(document["email"]) if document else None
+    if user is None:
+        detail = "Sesión cerrada por reutilización del token" if reason == "reused" else "Refresh token inválido o vencido"
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+    return await issue_tokens(user, document["family"])
+
+# Cerrar sesión: revoca el access token y la familia del refresh token
+@app.post("/logout", status_code=204)
+async def logout(request: Optional[LogoutRequest] = None, token: Optional[str] = Depends(optional_oauth2_scheme)):
+    if token:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            payload = {}
+        if payload.get("jti") and payload.get("exp"):
+            await revoke_access_token(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+            revocations.add(payload["jti"])
+    if request and request.refresh_token:
+        await revoke_refresh_token(db, request.refresh_token)
+
+# jtis revocados y aún no vencidos (los gateways los cargan en su filtro de Bloom)
+@app.get("/revocations", response_model=Revocations)
+async def get_revocations(since: Optional[datetime] = None):
+    now, jtis = await list_revocations(db, since)
+    return {"now": now, "jtis": jtis}
+
+# Verificación exacta de un jti, para los positivos del filtro
+@app.get("/revocations/{jti}")
+async def get_revocation(jti: str):
+    if not await is_access_token_revoked(db, jti):
+        raise HTTPException(status_code=404, detail="Token no revocado")
+    return {"jti": jti, "revoked": True}
+
+# Perfiles públicos de varios usuarios por email y/o id, en una sola consulta.
+# La identidad la fija el API Gateway, que no expone esta ruta en su proxy público.
+@app.post("/users/batch", response_model=List[PublicUser])
+async def get_users_batch(
+    request: UserBatchRequest,
+    current_email: Optional[str] = Header(None, alias="X-User-Email"),
+    current_role: Optional[str] = Header(None, alias="X-User-Role"),
+):
+    if not current_email:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Se requiere un usuario autenticado")
+    if current_role not in USERS_BATCH_ROLES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo vendedores y administradores")
+    emails = list(dict.fromkeys(request.emails))
+    ids = list(dict.fromkeys(request.ids))
+    if len(emails) + len(ids) > USERS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Se permiten como máximo {USERS_BATCH_MAX} usuarios por consulta")
+
+    keys = ["email:" + email for email in emails] + ["id:" + user_id for user_id in ids]
+    found = profile_cache.get_many(keys)
+    clauses = []
+    missing_emails = [email for email in emails if "email:" + email not in found]
+    if missing_emails:
+        clauses.append({"email": {"$in": missing_emails}})
+    missing_ids = [ObjectId(user_id) for user_id in ids if "id:" + user_id not in found and ObjectId.is_valid(user_id)]
+    if missing_ids:
+        clauses.append({"_id": {"$in": missing_ids}})
+    if clauses:
+        query = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        profiles = [to_profile(document) async for document in db.users.find(query, PROFILE_FIELDS)]
+        profile_cache.set_many(profiles)
+        for profile in profiles:
+            found["email:" + profile["email"]] = profile
+            found["id:" + profile["id"]] = profile
+
+    # En el orden pedido, sin repetir usuarios pedidos por email y por id; los inexistentes se omiten
+    users = {}
+    for key in keys:
+        if key in found:
+            users.setdefault(found[key]["id"], found[key])
+    return list(users.values())
 
 @app.get("/users/me", response_model=User)
-def read_users_me(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No se pudo validar las credenciales",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = get_user(email)
+async def read_users_me(token: str = Depends(oauth2_scheme)):
+    payload = decode_access_token(token)
+    if payload.get("jti") and await revocations.is_revoked(payload["jti"], confirm_revocation):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revocado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await get_user(payload["sub"])
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No se pudo validar las credenciales",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Migraciones versionadas de la base de autenticación (MongoDB).
+
+En Mongo el esquema son los índices. Se corren una sola vez por despliegue,
+antes de levantar las réplicas (en docker-compose lo hace el contenedor
+`auth-migrate`):
+
+    python migrations.py           # aplica las pendientes
+    python migrations.py --check   # código 1 si hay pendientes
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from typing import List
+
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient
+
+from common.config import settings
+from common.startup import connect_with_retry
+from tokens import ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+
+async def users_email_unique(db):
+    await db.users.create_index([("email", ASCENDING)], unique=True, name="users_email_unique")
+
+
+# (versión, descripción, función que recibe la base); las versiones publicadas no se reescriben
+MIGRATIONS = [
+    (1, "índice único de email en users", users_email_unique),
+    (2, "índices de refresh tokens y revocaciones", ensure_indexes),
+]
+
+# Versión que necesita este código; /ready no responde 200 hasta que la base la alcance
+SCHEMA_VERSION = max(version for version, _, _ in MIGRATIONS)
+
+
+async def schema_version(db) -> int:
+    document = await db.schema_migrations.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    return document["_id"] if document else 0
+
+
+async def migrate(db) -> List[int]:
+    """Aplica en orden las migraciones pendientes y devuelve las versiones aplicadas."""
+    applied = []
+    current = await schema_version(db)
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Aplicando migración %d: %s", version, description)
+        # create_index es idempotente: si dos corridas coinciden, la segunda no cambia nada
+        await apply(db)
+        await db.schema_migrations.update_one(
+            {"_id": version},
+            {"$setOnInsert": {"description": description, "applied_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        applied.append(version)
+    return applied
+
+
+async def database_ready(client, db) -> bool:
+    """Mongo responde y los índices ya están en la versión que espera el código."""
+    await client.admin.command("ping")
+    return await schema_version(db) >= SCHEMA_VERSION
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="solo informa si hay migraciones pendientes (código 1 si las hay)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def run() -> int:
+        client = AsyncMongoClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_DB]
+        try:
+            await connect_with_retry(lambda: client.admin.command("ping"), "MongoDB")
+            if args.check:
+                current = await schema_version(db)
+                print(f"Versión del esquema: {current} (última: {SCHEMA_VERSION})")
+                return 0 if current >= SCHEMA_VERSION else 1
+            applied = await migrate(db)
+            print(f"Migraciones aplicadas: {applied or 'ninguna'}")
+            return 0
+        finally:
+            await client.close()
+
+    sys.exit(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
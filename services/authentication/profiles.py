@@ -0,0 +1,47 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+# Campos públicos de un usuario: los que otros servicios pueden mostrar
+PROFILE_FIELDS = {"_id": 1, "email": 1, "full_name": 1, "role": 1}
+
+
+def to_profile(document: dict) -> dict:
+    return {
+        "id": str(document["_id"]),
+        "email": document["email"],
+        "full_name": document.get("full_name"),
+        "role": document.get("role"),
+    }
+
+
+class ProfileCache:
+    """Cache LRU con TTL de perfiles públicos, accesible por email y por id."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, dict]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[1] <= now:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            found[key] = entry[0]
+        return found
+
+    def set_many(self, profiles: List[dict]):
+        expires_at = time.monotonic() + self.ttl
+        for profile in profiles:
+            for key in ("email:" + profile["email"], "id:" + profile["id"]):
+                self._entries[key] = (profile, expires_at)
+                self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
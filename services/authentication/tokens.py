@@ -0,0 +1,105 @@
+import hashlib
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from pymongo import ASCENDING
+
+# Margen al listar revocaciones por fecha, por si los relojes de las réplicas difieren un poco
+REVOCATION_CLOCK_SKEW = timedelta(seconds=5)
+
+
+def new_jti() -> str:
+    return uuid.uuid4().hex
+
+
+def _token_id(refresh_token: str) -> str:
+    # Solo se guarda el hash: una copia de la base no sirve para renovar sesiones
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+async def ensure_indexes(db):
+    # Los TTL hacen que Mongo borre solo los tokens vencidos
+    await db.refresh_tokens.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, name="refresh_tokens_ttl")
+    await db.refresh_tokens.create_index([("family", ASCENDING)], name="refresh_tokens_family")
+    await db.revoked_tokens.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, name="revoked_tokens_ttl")
+    await db.revoked_tokens.create_index([("revoked_at", ASCENDING)], name="revoked_tokens_revoked_at")
+
+
+async def issue_refresh_token(db, email: str, expires_in: timedelta, family: Optional[str] = None) -> str:
+    """
+    Crea un refresh token de un solo uso.
+
+    Todos los tokens que salen de un mismo login comparten `family`: si uno ya
+    usado vuelve a aparecer, se asume robado y se invalida la familia completa.
+    """
+    refresh_token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    await db.refresh_tokens.insert_one({
+        "_id": _token_id(refresh_token),
+        "email": email,
+        "family": family or uuid.uuid4().hex,
+        "created_at": now,
+        "expires_at": now + expires_in,
+        "used_at": None,
+    })
+    return refresh_token
+
+
+async def use_refresh_token(db, refresh_token: str) -> Tuple[Optional[dict], str]:
+    """
+    Marca el refresh token como usado y devuelve (documento, motivo).
+
+    El motivo es "ok", "unknown", "expired" o "reused". El update condicional
+    garantiza que dos renovaciones simultáneas con el mismo token no ganen ambas.
+    """
+    now = datetime.utcnow()
+    token_id = _token_id(refresh_token)
+    document = await db.refresh_tokens.find_one_and_update(
+        {"_id": token_id, "used_at": None},
+        {"$set": {"used_at": now}},
+    )
+    if document is None:
+        existing = await db.refresh_tokens.find_one({"_id": token_id}, {"family": 1})
+        if existing is None:
+            return None, "unknown"
+        await revoke_family(db, existing["family"])
+        return None, "reused"
+    if document["expires_at"] <= now:
+        return None, "expired"
+    return document, "ok"
+
+
+async def revoke_family(db, family: str):
+    await db.refresh_tokens.delete_many({"family": family})
+
+
+async def revoke_refresh_token(db, refresh_token: str):
+    """Cierra la sesión a la que pertenece el refresh token."""
+    document = await db.refresh_tokens.find_one({"_id": _token_id(refresh_token)}, {"family": 1})
+    if document is not None:
+        await revoke_family(db, document["family"])
+
+
+async def revoke_access_token(db, jti: str, expires_at: datetime):
+    """Agrega el jti a la lista de revocados hasta que el token vencería de todos modos."""
+    await db.revoked_tokens.update_one(
+        {"_id": jti},
+        {"$setOnInsert": {"revoked_at": datetime.utcnow(), "expires_at": expires_at}},
+        upsert=True,
+    )
+
+
+async def is_access_token_revoked(db, jti: str) -> bool:
+    return await db.revoked_tokens.find_one({"_id": jti}, {"_id": 1}) is not None
+
+
+async def list_revocations(db, since: Optional[datetime]) -> Tuple[datetime, List[str]]:
+    """Devuelve (fecha de corte para la próxima consulta, jtis revocados desde `since`)."""
+    now = datetime.utcnow()
+    query = {"expires_at": {"$gt": now}}
+    if since is not None:
+        query["revoked_at"] = {"$gte": since - REVOCATION_CLOCK_SKEW}
+    jtis = [document["_id"] async for document in db.revoked_tokens.find(query, {"_id": 1})]
+    return now, jtis
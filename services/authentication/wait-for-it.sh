@@ -1,12 +0,0 @@
-#!/bin/sh
-# wait-for-it.sh
-
-host="$1"
-shift
-
-until nc -z ${host%:*} ${host#*:}; do
-    echo "Esperando a $host..."
-    sleep 2
-done
-
-exec "$@"
\ No newline at end of file
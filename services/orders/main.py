@@ -1,30 +1,165 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Response
+from contextlib import asynccontextmanager
+from sqlalchemy import Select, delete, insert, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from datetime import datetime
+import asyncio
+import base64
+import json
+import logging
+import os
 from common.config import settings
+from common.database import create_database, session_dependency, wait_for_database
+from common.events import EventConsumer, add_event, create_broker, relay_outbox
+from common.metrics import instrument_app
+from common.migrations import database_ready
+from common.startup import check_ready
+from common.tracing import instrument_tracing
 
-from models import Base, Order, OrderCreate, OrderRead, OrderItem, OrderItemCreate
+from models import (
+    Order,
+    OrderBatchCreate,
+    OrderCreate,
+    OrderRead,
+    OrderItem,
+    OrderItemCreate,
+    OrderItemRead,
+    OutboxEvent,
+    ProcessedEvent,
+    ProductOwner,
+)
+from migrations import SCHEMA_VERSION
 
 # Configuración DB
 DATABASE_URL = settings.ORDERS_DB_URL
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Máximo de órdenes por petición en la creación por lote
+MAX_BATCH_ORDERS = int(os.getenv("ORDERS_MAX_BATCH_SIZE", "500"))
 
-# Crear tablas
-Base.metadata.create_all(bind=engine)
+# Paginación de los listados de órdenes
+DEFAULT_PAGE_SIZE = int(os.getenv("ORDERS_DEFAULT_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = int(os.getenv("ORDERS_MAX_PAGE_SIZE", "100"))
+MAX_FILTER_PRODUCTS = int(os.getenv("ORDERS_MAX_FILTER_PRODUCTS", "200"))
 
+# Roles del header X-User-Role que fija el gateway: el administrador ve las órdenes de todos
+# y el vendedor solo las que incluyen productos suyos
+ADMIN_ROLE = "admin"
+SELLER_ROLE = "vendedor"
 
-# Inicialización de la app
-app = FastAPI(title="Orders Service", version="1.0.0")
+engine, SessionLocal = create_database(DATABASE_URL, "orders")
 
-# Dependencia de sesión
-def get_db():
-    db = SessionLocal()
+logger = logging.getLogger(__name__)
+
+
+# -------- Eventos --------
+# Estado de la orden según los eventos de pagos y productos. Los eventos pueden llegar en
+# cualquier orden: el resultado del pago y el rechazo solo se aplican a órdenes pendientes.
+PAYMENT_STATUSES = {"payment.completed": "pagado", "payment.failed": "pago_rechazado"}
+REJECTED_STATUSES = ("rechazada", "sin_stock")
+# Cobrada y rechazada a la vez: hay que devolver el pago (evento order.refund_requested)
+REFUND_STATUS = "reembolso_pendiente"
+
+
+async def set_order_status(db: AsyncSession, order_id: int, status: str, from_statuses) -> bool:
+    """Cambia el estado solo si la orden está en alguno de `from_statuses`; indica si lo cambió."""
+    result = await db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status.in_(from_statuses))
+        .values(status=status)
+    )
+    return result.rowcount > 0
+
+
+async def request_refund(db: AsyncSession, order_id: int, from_statuses, reason: str):
+    if await set_order_status(db, order_id, REFUND_STATUS, from_statuses):
+        add_event(db, OutboxEvent, "order.refund_requested", {"order_id": order_id, "reason": reason})
+        return True
+    return False
+
+
+def on_payment(event_type: str):
+    async def handle(db: AsyncSession, payload: dict):
+        order_id = payload["order_id"]
+        if await set_order_status(db, order_id, PAYMENT_STATUSES[event_type], ("pendiente",)):
+            return
+        # Se cobró una orden que productos ya había rechazado
+        if event_type == "payment.completed" and await request_refund(db, order_id, REJECTED_STATUSES, "rejected"):
+            return
+        logger.info("Se ignora %s para la orden %s: ya no está pendiente", event_type, order_id)
+    return handle
+
+
+async def on_order_rejected(db: AsyncSession, payload: dict):
+    # Productos no pudo descontar el stock de la orden, o la orden no era válida
+    order_id = payload["order_id"]
+    reason = payload.get("reason")
+    status = "rechazada" if reason == "invalid" else "sin_stock"
+    if await set_order_status(db, order_id, status, ("pendiente",)):
+        return
+    # Si ya se cobró, no se pisa el pago: se pide el reembolso
+    if await request_refund(db, order_id, ("pagado",), reason or "stock"):
+        return
+    logger.info("Se ignora order.rejected para la orden %s: ya no está pendiente", order_id)
+
+
+async def on_product_saved(db: AsyncSession, payload: dict):
+    statement = pg_insert(ProductOwner).values(
+        product_id=payload["product_id"], owner_email=payload.get("owner_email"), price=payload.get("price")
+    )
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[ProductOwner.product_id],
+        set_={"owner_email": statement.excluded.owner_email, "price": statement.excluded.price},
+    ))
+
+
+async def on_product_deleted(db: AsyncSession, payload: dict):
+    await db.execute(delete(ProductOwner).where(ProductOwner.product_id == payload["product_id"]))
+
+
+consumer = EventConsumer(
+    "orders",
+    SessionLocal,
+    ProcessedEvent,
+    {
+        "payment.completed": on_payment("payment.completed"),
+        "payment.failed": on_payment("payment.failed"),
+        "order.rejected": on_order_rejected,
+        "product.created": on_product_saved,
+        "product.updated": on_product_saved,
+        "product.deleted": on_product_deleted,
+    },
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # La primera conexión se abre acá y no al importar; el esquema lo crean las migraciones
+    await wait_for_database(engine)
+    broker = create_broker()
+    tasks = [
+        asyncio.create_task(relay_outbox(broker, SessionLocal, OutboxEvent, "orders")),
+        asyncio.create_task(consumer.run(broker)),
+    ]
     try:
-        yield db
+        yield
     finally:
-        db.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await broker.aclose()
+        await engine.dispose()
+
+
+# Inicialización de la app
+app = FastAPI(title="Orders Service", version="1.0.0", lifespan=lifespan)
+instrument_app(app, "orders")
+instrument_tracing(app, "orders")
+
+# Dependencia de sesión
+get_db = session_dependency(SessionLocal)
 
 
 # Endpoints
@@ -32,31 +167,269 @@ def get_db():
 def health():
     return {"status": "ok", "service": "orders"}
 
+# A diferencia de /health, verifica que el pool llegue a la base y que el esquema esté migrado
+@app.get("/ready")
+async def ready():
+    if not await check_ready(lambda: database_ready(engine, SCHEMA_VERSION)):
+        raise HTTPException(status_code=503, detail="El servicio todavía no puede atender")
+    return {"status": "ready", "service": "orders"}
+
+
+async def write_orders(db: AsyncSession, user_email: str, orders: List[OrderCreate]) -> List[OrderRead]:
+    """
+    Guarda las órdenes y sus ítems en una sola transacción.
+
+    Un flush obtiene los ids de las órdenes y todos los ítems se insertan en un
+    único INSERT de varias filas con RETURNING, así la cantidad de idas y vueltas
+    a la base no crece con la cantidad de líneas. Si algo falla no queda nada escrito.
+    Cada orden deja un evento `order.created` en el outbox en la misma transacción.
+    El precio de cada ítem sale de la copia local del catálogo (ProductOwner).
+    """
+    product_ids = {item.product_id for order in orders for item in order.items}
+    prices = dict((await db.execute(
+        select(ProductOwner.product_id, ProductOwner.price).where(ProductOwner.product_id.in_(product_ids))
+    )).all())
+
+    db_orders = [Order(user_email=user_email) for _ in orders]
+    db.add_all(db_orders)
+    await db.flush()
+
+    rows = [
+        {
+            "order_id": db_order.id,
+            "product_id": item.product_id,
+            "quantity": item.quantity,
+            "price": prices.get(item.product_id),
+        }
+        for db_order, order in zip(db_orders, orders)
+        for item in order.items
+    ]
+    items_by_order = {db_order.id: [] for db_order in db_orders}
+    if rows:
+        result = await db.execute(
+            insert(OrderItem).values(rows).returning(
+                OrderItem.id, OrderItem.order_id, OrderItem.product_id, OrderItem.quantity, OrderItem.price
+            )
+        )
+        for row in result:
+            items_by_order[row.order_id].append(
+                OrderItemRead(id=row.id, product_id=row.product_id, quantity=row.quantity, price=row.price)
+            )
+
+    for db_order, order in zip(db_orders, orders):
+        add_event(db, OutboxEvent, "order.created", {
+            "order_id": db_order.id,
+            "user_email": db_order.user_email,
+            "items": [{"product_id": item.product_id, "quantity": item.quantity} for item in order.items],
+        })
+
+    # Se arma la respuesta antes del commit para no volver a leer lo que se acaba de escribir
+    created = [
+        OrderRead(
+            id=db_order.id,
+            user_email=db_order.user_email,
+            status=db_order.status,
+            created_at=db_order.created_at,
+            items=sorted(items_by_order[db_order.id], key=lambda item: item.id),
+        )
+        for db_order in db_orders
+    ]
+    await db.commit()
+    return created
+
+
+def require_user(user_email: Optional[str]) -> str:
+    """Email que el API Gateway inyecta tras verificar el token; sin él la petición es anónima."""
+    if not user_email:
+        raise HTTPException(status_code=401, detail="Se requiere un usuario autenticado")
+    return user_email
+
+
+def is_admin(role: Optional[str]) -> bool:
+    return role == ADMIN_ROLE
+
+
+def owned_products(seller_email: str) -> Select:
+    """Ids de los productos del vendedor, como subconsulta."""
+    return select(ProductOwner.product_id).where(ProductOwner.owner_email == seller_email)
+
+
+async def seller_views(db: AsyncSession, seller_email: str, orders: List[Order]) -> List[OrderRead]:
+    """Las órdenes tal como las ve un vendedor: solo con los ítems de sus productos."""
+    item_ids = {item.product_id for order in orders for item in order.items}
+    if not item_ids:
+        return []
+    owned = set((await db.execute(
+        owned_products(seller_email).where(ProductOwner.product_id.in_(item_ids))
+    )).scalars())
+    views = []
+    for order in orders:
+        view = OrderRead.from_orm(order)
+        view.items = [item for item in view.items if item.product_id in owned]
+        if view.items:
+            views.append(view)
+    return views
+
 
 @app.post("/orders", response_model=OrderRead, status_code=201)
-def create_order(order: OrderCreate, db: Session = Depends(get_db)):
-    db_order = Order(user_email="cliente@test.com")
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+async def create_order(
+    order: OrderCreate,
+    db: AsyncSession = Depends(get_db),
+    user_email: Optional[str] = Header(None, alias="X-User-Email"),
+):
+    return (await write_orders(db, require_user(user_email), [order]))[0]
 
-    for item in order.items:
-        db_item = OrderItem(order_id=db_order.id, product_id=item.product_id, quantity=item.quantity)
-        db.add(db_item)
 
-    db.commit()
-    db.refresh(db_order)
-    return db_order
+# Crear varias órdenes a la vez (integraciones B2B y marketplaces); todas o ninguna
+@app.post("/orders/batch", response_model=List[OrderRead], status_code=201)
+async def create_orders_batch(
+    batch: OrderBatchCreate,
+    db: AsyncSession = Depends(get_db),
+    user_email: Optional[str] = Header(None, alias="X-User-Email"),
+):
+    if len(batch.orders) > MAX_BATCH_ORDERS:
+        raise HTTPException(status_code=413, detail=f"Se permiten como máximo {MAX_BATCH_ORDERS} órdenes por lote")
+    return await write_orders(db, require_user(user_email), batch.orders)
+
+
+def encode_cursor(order: Order) -> str:
+    raw = json.dumps([order.created_at.isoformat(), order.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Devuelve (created_at, id) de la última orden de la página anterior."""
+    try:
+        created_at, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def filter_orders(
+    query: Select,
+    status: Optional[str],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+) -> Select:
+    if status:
+        query = query.where(Order.status == status)
+    if created_from:
+        query = query.where(Order.created_at >= created_from)
+    if created_to:
+        query = query.where(Order.created_at < created_to)
+    return query
+
+
+async def paginate_orders(db: AsyncSession, query: Select, response: Response, limit: int, cursor: Optional[str]) -> List[Order]:
+    """
+    Página de órdenes de la más nueva a la más vieja, con keyset sobre (created_at, id).
+
+    Los ítems de toda la página se cargan con una sola consulta extra (selectinload)
+    en lugar de una por orden.
+    """
+    if cursor:
+        query = query.where(tuple_(Order.created_at, Order.id) < tuple_(*decode_cursor(cursor)))
+    orders = (await db.execute(
+        query.options(selectinload(Order.items))
+        .order_by(Order.created_at.desc(), Order.id.desc())
+        .limit(limit + 1)
+    )).scalars().all()
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(orders[-1])
+    return orders
+
+
+def parse_ids(ids: str) -> List[int]:
+    try:
+        product_ids = sorted({int(value) for value in ids.split(",") if value.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Los ids deben ser números separados por coma")
+    if not product_ids:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un producto")
+    if len(product_ids) > MAX_FILTER_PRODUCTS:
+        raise HTTPException(status_code=400, detail=f"Se permiten como máximo {MAX_FILTER_PRODUCTS} productos")
+    return product_ids
 
 
 @app.get("/orders", response_model=list[OrderRead])
-def get_orders(db: Session = Depends(get_db)):
-    return db.query(Order).all()
+async def get_orders(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_email: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    current_email: Optional[str] = Header(None, alias="X-User-Email"),
+    current_role: Optional[str] = Header(None, alias="X-User-Role"),
+):
+    # Solo el administrador puede listar o filtrar las órdenes de otros usuarios
+    current_email = require_user(current_email)
+    if not is_admin(current_role):
+        user_email = current_email
+
+    query = select(Order)
+    if user_email:
+        query = query.where(Order.user_email == user_email)
+    query = filter_orders(query, status, created_from, created_to)
+    return await paginate_orders(db, query, response, limit, cursor)
+
+
+# Órdenes que incluyen alguno de los productos indicados. Vista del vendedor: solo productos
+# suyos, y sin `product_ids` todos los que publicó
+@app.get("/orders/by-product", response_model=list[OrderRead])
+async def get_orders_by_product(
+    response: Response,
+    product_ids: Optional[str] = Query(None, description="Ids separados por coma, p. ej. 1,2,3"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    current_email: Optional[str] = Header(None, alias="X-User-Email"),
+    current_role: Optional[str] = Header(None, alias="X-User-Role"),
+):
+    current_email = require_user(current_email)
+    requested = parse_ids(product_ids) if product_ids is not None else None
+    if is_admin(current_role):
+        if requested is None:
+            raise HTTPException(status_code=400, detail="Debe indicar al menos un producto")
+        query = select(Order).where(Order.items.any(OrderItem.product_id.in_(requested)))
+        query = filter_orders(query, status, created_from, created_to)
+        return await paginate_orders(db, query, response, limit, cursor)
+    if current_role != SELLER_ROLE:
+        raise HTTPException(status_code=403, detail="Solo vendedores y administradores")
+
+    # Los ids ajenos se descartan en silencio; si no queda ninguno la página sale vacía
+    owned = owned_products(current_email)
+    if requested is not None:
+        owned = owned.where(ProductOwner.product_id.in_(requested))
+    query = select(Order).where(Order.items.any(OrderItem.product_id.in_(owned)))
+    query = filter_orders(query, status, created_from, created_to)
+    orders = await paginate_orders(db, query, response, limit, cursor)
+    return await seller_views(db, current_email, orders)
 
 
 @app.get("/orders/{order_id}", response_model=OrderRead)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.id == order_id).first()
+async def get_order(
+    order_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_email: Optional[str] = Header(None, alias="X-User-Email"),
+    current_role: Optional[str] = Header(None, alias="X-User-Role"),
+):
+    current_email = require_user(current_email)
+    order = await db.get(Order, order_id, options=[selectinload(Order.items)])
+    # Las órdenes ajenas responden igual que las inexistentes, para no revelar qué ids existen
     if not order:
         raise HTTPException(status_code=404, detail="Orden no encontrada")
-    return order
+    if order.user_email == current_email or is_admin(current_role):
+        return order
+    if current_role == SELLER_ROLE:
+        views = await seller_views(db, current_email, [order])
+        if views:
+            return views[0]
+    raise HTTPException(status_code=404, detail="Orden no encontrada")
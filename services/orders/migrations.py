@@ -0,0 +1,54 @@
+"""
+Migraciones versionadas del esquema de órdenes.
+
+Se corren una sola vez por despliegue, antes de levantar las réplicas del
+servicio (en docker-compose lo hace el contenedor `orders-migrate`):
+
+    python migrations.py           # aplica las pendientes
+    python migrations.py --check   # código 1 si hay pendientes
+"""
+from sqlalchemy import text
+
+from models import Base, ProductOwner
+from common.config import settings
+from common.migrations import Migration, latest_version, run_cli
+
+DATABASE_URL = settings.ORDERS_DB_URL
+
+
+def initial_schema(conn):
+    # Equivale al create_all que se hacía al arrancar: solo crea las tablas que falten.
+    # Las columnas e índices nuevos de tablas ya existentes van en las versiones siguientes.
+    Base.metadata.create_all(conn)
+
+
+# Idempotente: en una base nueva, create_all ya creó estos índices
+def order_listing_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_user_email_created_at ON orders (user_email, created_at, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_created_at_id ON orders (created_at, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_order_items_product_id_order_id ON order_items (product_id, order_id)"))
+
+
+def product_owners(conn):
+    ProductOwner.__table__.create(conn, checkfirst=True)
+
+
+def item_prices(conn):
+    conn.execute(text("ALTER TABLE order_items ADD COLUMN IF NOT EXISTS price DOUBLE PRECISION"))
+    conn.execute(text("ALTER TABLE product_owners ADD COLUMN IF NOT EXISTS price DOUBLE PRECISION"))
+
+
+MIGRATIONS = [
+    Migration(1, "esquema inicial", initial_schema),
+    Migration(2, "índices de los listados de órdenes", order_listing_indexes),
+    Migration(3, "vendedor de cada producto", product_owners),
+    Migration(4, "precio de los ítems de las órdenes", item_prices),
+]
+
+# Versión que necesita este código; /ready no responde 200 hasta que la base la alcance
+SCHEMA_VERSION = latest_version(MIGRATIONS)
+
+
+if __name__ == "__main__":
+    run_cli(DATABASE_URL, MIGRATIONS, __doc__)
@@ -1,13 +1,18 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field, conlist
+from typing import List, Optional
+
+from common.events import outbox_models
 
 # Base de SQLAlchemy
 Base = declarative_base()
 
+# Eventos por publicar y eventos ya aplicados (ver common/events.py)
+OutboxEvent, ProcessedEvent = outbox_models(Base)
+
 
 # MODELOS ORM (tablas en DB)
 class Order(Base):
@@ -20,23 +25,50 @@ class Order(Base):
 
     items = relationship("OrderItem", back_populates="order", cascade="all, delete")
 
+    __table_args__ = (
+        # Listado de órdenes de un cliente, de la más nueva a la más vieja
+        Index("ix_orders_user_email_created_at", "user_email", "created_at", "id"),
+        # Listado general paginado por (created_at, id)
+        Index("ix_orders_created_at_id", "created_at", "id"),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     product_id = Column(Integer, nullable=False)
     quantity = Column(Integer, nullable=False)
+    # Precio unitario al crear la orden; vacío si productos todavía no había avisado del producto
+    price = Column(Float, nullable=True)
 
     order = relationship("Order", back_populates="items")
 
+    __table_args__ = (
+        # Órdenes que incluyen alguno de los productos de un vendedor
+        Index("ix_order_items_product_id_order_id", "product_id", "order_id"),
+    )
+
+
+class ProductOwner(Base):
+    """
+    Vendedor y precio vigente de cada producto, copiados de los eventos product.* del servicio de productos.
+
+    Con esto las órdenes de un vendedor se filtran, y el precio de cada ítem se fija,
+    sin consultar a productos en cada petición.
+    """
+    __tablename__ = "product_owners"
+
+    product_id = Column(Integer, primary_key=True)
+    owner_email = Column(String, nullable=True, index=True)
+    price = Column(Float, nullable=True)
 
 
 # MODELOS Pydantic (validación)
 class OrderItemBase(BaseModel):
     product_id: int
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 
 class OrderItemCreate(OrderItemBase):
@@ -45,13 +77,18 @@ class OrderItemCreate(OrderItemBase):
 
 class OrderItemRead(OrderItemBase):
     id: int
+    price: Optional[float] = None
 
     class Config:
         orm_mode = True
 
 
 class OrderCreate(BaseModel):
-    items: List[OrderItemCreate]
+    items: conlist(OrderItemCreate, min_items=1)
+
+
+class OrderBatchCreate(BaseModel):
+    orders: conlist(OrderCreate, min_items=1)
 
 
 class OrderRead(BaseModel):
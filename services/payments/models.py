@@ -1,12 +1,19 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey
 from sqlalchemy.orm import declarative_base
-from datetime import datetime
+from datetime import date, datetime
 
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
+
+from common.events import outbox_models
 
 Base = declarative_base()
 
+# Eventos por publicar (ver common/events.py)
+OutboxEvent, ProcessedEvent = outbox_models(Base)
+
+PaymentStatus = Literal["pending", "completed", "failed"]
+
 # Modelo SQLAlchemy (tabla en DB)
 class Payment(Base):
     __tablename__ = "payments"
@@ -21,15 +28,29 @@ class Payment(Base):
     def __repr__(self):
         return f"<Payment(id={self.id}, order_id={self.order_id}, status='{self.status}')>"
 
+class PaymentRollup(Base):
+    """Cantidad y monto de pagos por día, método y estado; se mantiene al crear o cambiar pagos."""
+    __tablename__ = "payment_rollups"
+
+    day = Column(Date, primary_key=True)
+    method = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    amount = Column(Float, nullable=False, default=0)
+
 # -------- Pydantic Schemas --------
 class PaymentBase(BaseModel):
     order_id: int
     amount: float
     method: str
 
+# Todo pago nace pendiente; el estado solo lo cambia la pasarela o un administrador
 class PaymentCreate(PaymentBase):
     pass
 
+class PaymentStatusUpdate(BaseModel):
+    status: PaymentStatus
+
 class PaymentRead(PaymentBase):
     id: int
     status: str
@@ -39,3 +60,14 @@ class PaymentRead(PaymentBase):
         orm_mode = True
 
 
+
+class RevenueTotal(BaseModel):
+    method: Optional[str] = None
+    status: Optional[str] = None
+    count: int
+    amount: float
+
+class RevenuePoint(BaseModel):
+    period: date
+    count: int
+    amount: float
@@ -0,0 +1,135 @@
+from datetime import date
+from typing import Iterable, Tuple
+
+from sqlalchemy import Column, Date, Float, Integer, MetaData, String, Table, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from models import Payment, PaymentRollup
+
+# (día, método, estado, cantidad, monto) a sumar en la tabla de rollups
+Delta = Tuple[date, str, str, int, float]
+
+
+async def add_to_rollups(db: AsyncSession, deltas: Iterable[Delta]):
+    """
+    Suma cantidades y montos a los rollups con un upsert atómico por fila.
+
+    Se ejecuta en la misma transacción que el cambio del pago, así los reportes
+    nunca quedan desfasados de la tabla `payments`. Las filas se escriben en orden
+    de clave para que dos transacciones concurrentes no se bloqueen mutuamente.
+    """
+    rows = [
+        {"day": day, "method": method, "status": status, "count": count, "amount": amount}
+        for day, method, status, count, amount in sorted(deltas)
+    ]
+    if not rows:
+        return
+    statement = insert(PaymentRollup).values(rows)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[PaymentRollup.day, PaymentRollup.method, PaymentRollup.status],
+        set_={
+            "count": PaymentRollup.count + statement.excluded.count,
+            "amount": PaymentRollup.amount + statement.excluded.amount,
+        },
+    ))
+
+
+async def record_payment(db: AsyncSession, payment: Payment):
+    """Cuenta un pago recién creado."""
+    await add_to_rollups(db, [(payment.created_at.date(), payment.method, payment.status, 1, payment.amount)])
+
+
+async def record_status_change(db: AsyncSession, payment: Payment, old_status: str):
+    """Mueve un pago de la fila de su estado anterior a la del nuevo."""
+    day = payment.created_at.date()
+    await add_to_rollups(db, [
+        (day, payment.method, old_status, -1, -payment.amount),
+        (day, payment.method, payment.status, 1, payment.amount),
+    ])
+
+
+# Correcciones que calcula la reconstrucción antes de aplicarlas (tabla temporal de la conexión)
+rebuild_table = Table(
+    "payment_rollups_rebuild",
+    MetaData(),
+    Column("day", Date, nullable=False),
+    Column("method", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("count", Integer, nullable=False),
+    Column("amount", Float, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+
+async def rebuild_rollups(engine: AsyncEngine, batch_size: int) -> int:
+    """
+    Recalcula todos los rollups a partir de `payments`, por lotes de ids.
+
+    Primero, en una transacción REPEATABLE READ y sin bloquear escrituras, arma en
+    una tabla temporal la diferencia entre lo que dicen los pagos y lo que dicen
+    los rollups en esa misma foto. Después la suma a los rollups en una
+    transacción corta con la tabla bloqueada. Los pagos creados o cambiados
+    mientras tanto ya se sumaron solos, así que el resultado queda exacto sin
+    detenerlos durante todo el recálculo. Devuelve la cantidad de pagos procesados.
+    """
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="REPEATABLE READ")
+        async with conn.begin():
+            await conn.run_sync(rebuild_table.create)
+            # Se parte de los rollups actuales con signo negativo...
+            await conn.execute(insert(rebuild_table).from_select(
+                ["day", "method", "status", "count", "amount"],
+                select(PaymentRollup.day, PaymentRollup.method, PaymentRollup.status, -PaymentRollup.count, -PaymentRollup.amount),
+            ))
+            # ...y se suman los pagos de la misma foto
+            processed = 0
+            last_id = 0
+            while True:
+                batch = (
+                    select(Payment.id)
+                    .where(Payment.id > last_id)
+                    .order_by(Payment.id)
+                    .limit(batch_size)
+                    .subquery()
+                )
+                day = func.date(Payment.created_at)
+                rows = (await conn.execute(
+                    select(day, Payment.method, Payment.status, func.count(), func.sum(Payment.amount), func.max(Payment.id))
+                    .join(batch, batch.c.id == Payment.id)
+                    .group_by(day, Payment.method, Payment.status)
+                )).all()
+                if not rows:
+                    break
+                await conn.execute(insert(rebuild_table).values([
+                    {"day": row[0], "method": row[1], "status": row[2], "count": row[3], "amount": row[4]} for row in rows
+                ]))
+                processed += sum(row[3] for row in rows)
+                last_id = max(row[5] for row in rows)
+
+        await conn.execution_options(isolation_level="READ COMMITTED")
+        async with conn.begin():
+            # Bloqueo corto: solo lo que tarda aplicar las correcciones agrupadas
+            await conn.execute(text("LOCK TABLE payment_rollups IN EXCLUSIVE MODE"))
+            corrections = (
+                select(
+                    rebuild_table.c.day,
+                    rebuild_table.c.method,
+                    rebuild_table.c.status,
+                    func.sum(rebuild_table.c.count),
+                    func.sum(rebuild_table.c.amount),
+                )
+                .group_by(rebuild_table.c.day, rebuild_table.c.method, rebuild_table.c.status)
+                .order_by(rebuild_table.c.day, rebuild_table.c.method, rebuild_table.c.status)
+            )
+            statement = insert(PaymentRollup).from_select(["day", "method", "status", "count", "amount"], corrections)
+            await conn.execute(statement.on_conflict_do_update(
+                index_elements=[PaymentRollup.day, PaymentRollup.method, PaymentRollup.status],
+                set_={
+                    "count": PaymentRollup.count + statement.excluded.count,
+                    "amount": PaymentRollup.amount + statement.excluded.amount,
+                },
+            ))
+            await conn.execute(delete(PaymentRollup).where(PaymentRollup.count == 0))
+            await conn.run_sync(rebuild_table.drop)
+    return processed
@@ -0,0 +1,88 @@
+"""
+Benchmark de reservas de stock sobre un solo producto muy demandado.
+
+Crea un producto con stock limitado y lanza muchas compras concurrentes de
+una unidad contra `POST /reservations`. Reporta el throughput, cuántas
+reservas se aceptaron y verifica que no haya sobreventa.
+
+Uso (con el stack levantado, a través del API Gateway; requiere httpx):
+
+    python bench_reservations.py --url http://localhost:8000/products --stock 1000 --buyers 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def run(url: str, stock: int, buyers: int, concurrency: int, quantity: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        created = await client.post("/products/", json={
+            "name": "Producto benchmark",
+            "description": "SKU de alta demanda",
+            "price": 1000,
+            "stock": stock,
+        })
+        created.raise_for_status()
+        product_id = created.json()["id"]
+
+        semaphore = asyncio.Semaphore(concurrency)
+        results = {"accepted": 0, "rejected": 0, "errors": 0}
+        latencies = []
+
+        async def buy():
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/reservations", json={
+                        "items": [{"product_id": product_id, "quantity": quantity}],
+                    })
+                except httpx.RequestError:
+                    results["errors"] += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+                if response.status_code == 201:
+                    results["accepted"] += 1
+                elif response.status_code == 409:
+                    results["rejected"] += 1
+                else:
+                    results["errors"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(buy() for _ in range(buyers)))
+        elapsed = time.perf_counter() - started
+
+        final_stock = (await client.get(f"/products/{product_id}")).json()["stock"]
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    sold = stock - final_stock
+
+    print(f"Compras:        {buyers} ({concurrency} concurrentes)")
+    print(f"Tiempo total:   {elapsed:.2f} s")
+    print(f"Throughput:     {buyers / elapsed:.0f} reservas/s")
+    print(f"Latencia:       p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+    print(f"Aceptadas:      {results['accepted']}")
+    print(f"Sin stock:      {results['rejected']}")
+    print(f"Errores:        {results['errors']}")
+    print(f"Stock final:    {final_stock}")
+    ok = final_stock >= 0 and sold == results["accepted"] * quantity
+    print("Sobreventa:     " + ("no" if ok else "¡SÍ! el stock no cuadra con las reservas aceptadas"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/products")
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--buyers", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--quantity", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.stock, args.buyers, args.concurrency, args.quantity))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+from models import ProductRead
+
+
+class ProductCache:
+    """
+    Cache LRU con TTL de productos ya serializados, local a cada proceso.
+
+    Se usa solo desde el event loop y ningún método tiene `await`, así que cada
+    operación es atómica sin necesidad de un lock.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Se incrementa en cada invalidación; quien lee de la base la toma antes de consultar
+        self.generation = 0
+        # Generación en la que se invalidó cada producto, para descartar solo esos al guardar
+        self._invalidated: "OrderedDict[int, int]" = OrderedDict()
+        # Las lecturas anteriores a esta generación se descartan enteras (clear o registro recortado)
+        self._floor = 0
+        self._entries: "OrderedDict[int, Tuple[ProductRead, float]]" = OrderedDict()
+
+    def get_many(self, product_ids: Iterable[int]) -> Dict[int, ProductRead]:
+        """Devuelve los productos vigentes en cache; los que falten hay que buscarlos en la base."""
+        now = time.monotonic()
+        found: Dict[int, ProductRead] = {}
+        for product_id in product_ids:
+            entry = self._entries.get(product_id)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[product_id]
+                continue
+            self._entries.move_to_end(product_id)
+            found[product_id] = entry[0]
+        return found
+
+    def set_many(self, products: List[ProductRead], generation: int):
+        expires_at = time.monotonic() + self.ttl
+        if generation < self._floor:
+            return
+        for product in products:
+            if self._invalidated.get(product.id, 0) > generation:
+                # Se modificó mientras se leía: la copia leída puede estar vieja
+                continue
+            self._entries[product.id] = (product, expires_at)
+            self._entries.move_to_end(product.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, product_ids: Iterable[int]):
+        self.generation += 1
+        for product_id in product_ids:
+            self._entries.pop(product_id, None)
+            self._invalidated[product_id] = self.generation
+            self._invalidated.move_to_end(product_id)
+        while len(self._invalidated) > self.max_entries:
+            _, generation = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, generation)
+
+    def clear(self):
+        self.generation += 1
+        self._floor = self.generation
+        self._invalidated.clear()
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
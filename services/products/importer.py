@@ -0,0 +1,164 @@
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import OutboxEvent, Product, ProductCreate, product_event
+from common.events import add_event
+
+# Columnas que se sobrescriben cuando el SKU ya existe
+UPSERT_COLUMNS = ("name", "description", "price", "stock")
+# Columnas que devuelve cada INSERT para armar los eventos product.*
+EVENT_COLUMNS = (Product.id, Product.sku, Product.owner_email, Product.price, Product.stock, Product.is_active)
+
+
+class LineTooLong(Exception):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Hay una línea de más de {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+async def iter_lines(stream: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Parte un stream de bytes en líneas sin cargarlo completo en memoria (sin decodificar).
+
+    De cada chunk solo se guarda el final de la línea incompleta; si una línea pasa
+    de `max_line_bytes` se lanza LineTooLong en lugar de seguir acumulando.
+    """
+    pending: List[bytes] = []
+    pending_size = 0
+    async for chunk in stream:
+        *lines, rest = chunk.split(b"\n")
+        for line in lines:
+            if pending:
+                line = b"".join(pending) + line
+                pending, pending_size = [], 0
+            if len(line) > max_line_bytes:
+                raise LineTooLong(max_line_bytes)
+            yield line.rstrip(b"\r")
+        if rest:
+            pending.append(rest)
+            pending_size += len(rest)
+            if pending_size > max_line_bytes:
+                raise LineTooLong(max_line_bytes)
+    if pending:
+        yield b"".join(pending).rstrip(b"\r")
+
+
+def decode_line(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise ValueError(f"La línea no es UTF-8 válido (byte {e.start})")
+
+
+async def iter_records(stream: AsyncIterator[bytes], is_csv: bool, max_line_bytes: int) -> AsyncIterator[tuple]:
+    """
+    Produce (número de fila, datos o None, error o None) por cada fila del archivo.
+
+    En CSV la primera línea es el encabezado; las filas no pueden contener saltos de línea.
+    Una línea mal codificada se reporta como error de esa fila; si es el encabezado
+    (fila 0) no se puede leer nada más.
+    """
+    header: Optional[List[str]] = None
+    row_number = 0
+    async for raw in iter_lines(stream, max_line_bytes):
+        if not raw.strip():
+            continue
+        if is_csv and header is None:
+            try:
+                header = [name.strip() for name in next(csv.reader([decode_line(raw)]))]
+            except (ValueError, csv.Error) as e:
+                yield 0, None, str(e)
+                return
+            continue
+        row_number += 1
+        try:
+            line = decode_line(raw)
+            if is_csv:
+                values = next(csv.reader([line]))
+                data = {name: value for name, value in zip(header, values) if value != ""}
+            else:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError("Se esperaba un objeto JSON")
+        except (ValueError, csv.Error) as e:
+            yield row_number, None, str(e)
+            continue
+        yield row_number, data, None
+
+
+def validate_row(data: Dict[str, Any]) -> Dict[str, Any]:
+    product = ProductCreate(**data).dict()
+    product["sku"] = product.get("sku") or None
+    return product
+
+
+def describe_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors())
+
+
+async def write_batch(db: AsyncSession, rows: List[Dict[str, Any]], owner_email: Optional[str]) -> Dict[str, Any]:
+    """
+    Inserta un lote con INSERT de múltiples filas en una sola transacción.
+
+    Las filas con SKU hacen upsert (ON CONFLICT sobre el SKU); si el SKU se repite
+    dentro del lote, gana la última fila. Con `owner_email` solo se actualizan los
+    productos de ese vendedor: los SKU ajenos se devuelven en `foreign_skus`.
+    Cada producto escrito deja su product.created o product.updated en el outbox,
+    en la misma transacción, igual que la edición de a uno.
+    """
+    with_sku = list({row["sku"]: row for row in rows if row["sku"]}.values())
+    without_sku = [row for row in rows if not row["sku"]]
+    created = updated = 0
+    foreign_skus: List[str] = []
+
+    if with_sku:
+        statement = insert(Product).values(with_sku)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Product.sku],
+            set_={column: statement.excluded[column] for column in UPSERT_COLUMNS},
+            where=(Product.owner_email == owner_email) if owner_email is not None else None,
+        ).returning(*EVENT_COLUMNS, literal_column("xmax = 0").label("inserted"))
+        written = set()
+        for product in await db.execute(statement):
+            written.add(product.sku)
+            if product.inserted:
+                created += 1
+            else:
+                updated += 1
+            add_event(db, OutboxEvent, "product.created" if product.inserted else "product.updated", product_event(product))
+        foreign_skus = [row["sku"] for row in with_sku if row["sku"] not in written]
+
+    if without_sku:
+        for product in await db.execute(insert(Product).values(without_sku).returning(*EVENT_COLUMNS)):
+            add_event(db, OutboxEvent, "product.created", product_event(product))
+        created += len(without_sku)
+
+    await db.commit()
+    return {"created": created, "updated": updated, "foreign_skus": foreign_skus}
+
+
+async def write_batch_safely(
+    session_factory, rows: List[Dict[str, Any]], row_numbers: List[int], owner_email: Optional[str]
+) -> Dict[str, Any]:
+    """Escribe un lote en su propia sesión; si falla, el error se reporta para todas sus filas."""
+    async with session_factory() as db:
+        try:
+            result = await write_batch(db, rows, owner_email)
+            foreign = set(result.pop("foreign_skus"))
+            result["errors"] = [
+                {"row": number, "error": "El SKU pertenece a otro vendedor"}
+                for row, number in zip(rows, row_numbers)
+                if row["sku"] in foreign
+            ]
+            return result
+        except SQLAlchemyError as e:
+            await db.rollback()
+            message = str(getattr(e, "orig", e)).strip()
+            return {"created": 0, "updated": 0, "errors": [{"row": number, "error": message} for number in row_numbers]}
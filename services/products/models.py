@@ -1,27 +1,97 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Index, Computed, ForeignKey
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import declarative_base, deferred, relationship
 from datetime import datetime
 
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from common.events import outbox_models
 
 Base = declarative_base()
 
+# Eventos por publicar y eventos ya aplicados (ver common/events.py)
+OutboxEvent, ProcessedEvent = outbox_models(Base)
+
+# Configuración de texto de la búsqueda. El índice se calcula en Postgres con ella,
+# así que cambiarla requiere una migración que regenere search_vector.
+SEARCH_CONFIG = "spanish"
+SEARCH_VECTOR_EXPRESSION = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')"
+)
+
 # Modelo en DB
 class Product(Base):
     __tablename__ = "products"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
+    sku = Column(String, unique=True, nullable=True)  # código del vendedor, clave de la importación masiva
     description = Column(String, nullable=True)
     price = Column(Float, nullable=False)
     stock = Column(Integer, default=0)  # cantidad disponible
     is_active = Column(Boolean, default=True)
+    # Vendedor que lo publicó (X-User-Email al crearlo); vacío en los productos anteriores
+    owner_email = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Texto indexado para la búsqueda; Postgres lo recalcula en cada INSERT/UPDATE.
+    # deferred: no se lee salvo que se pida, así no viaja en cada consulta del catálogo.
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(SEARCH_VECTOR_EXPRESSION, persisted=True),
+    ))
+
+    # Índices para la paginación por cursor y los filtros del catálogo
+    __table_args__ = (
+        Index("ix_products_active_created_at", "is_active", "created_at", "id"),
+        Index("ix_products_active_price", "is_active", "price", "id"),
+        Index("ix_products_name_prefix", "name", postgresql_ops={"name": "varchar_pattern_ops"}),
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        # Listado de los productos de un vendedor
+        Index("ix_products_owner_email_created_at", "owner_email", "created_at", "id"),
+    )
 
     def __repr__(self):
         return f"<Product(id={self.id}, name='{self.name}', price={self.price})>"
 
+def product_event(product) -> dict:
+    """Payload de product.created y product.updated, desde un Product o una fila con sus columnas."""
+    return {
+        "product_id": product.id,
+        "sku": product.sku,
+        "owner_email": product.owner_email,
+        "price": product.price,
+        "stock": product.stock,
+        "is_active": product.is_active,
+    }
+
+class StockReservation(Base):
+    """Stock apartado para una compra; se descuenta al reservar y se devuelve si se libera o vence."""
+    __tablename__ = "stock_reservations"
+
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False, default="active")  # active, committed, released, expired
+    # Quién la creó por la API; vacío en lo descontado por los eventos de órdenes
+    user_email = Column(String, nullable=True)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    items = relationship("StockReservationItem", cascade="all, delete-orphan", lazy="selectin")
+
+    __table_args__ = (
+        Index("ix_stock_reservations_status_expires_at", "status", "expires_at"),
+    )
+
+
+class StockReservationItem(Base):
+    __tablename__ = "stock_reservation_items"
+
+    id = Column(Integer, primary_key=True)
+    reservation_id = Column(String, ForeignKey("stock_reservations.id", ondelete="CASCADE"), nullable=False, index=True)
+    product_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+
 # -------- Schemas Pydantic --------
 class ProductBase(BaseModel):
     name: str
@@ -29,15 +99,39 @@ class ProductBase(BaseModel):
     price: float
     stock: int
 
+# El SKU se fija al crear o importar; la edición no lo cambia
 class ProductCreate(ProductBase):
+    sku: Optional[str] = None
+
+class ProductUpdate(ProductBase):
     pass
 
 class ProductRead(ProductBase):
     id: int
+    sku: Optional[str] = None
     is_active: bool
     created_at: datetime
 
     class Config:
         orm_mode = True
 
+class ReservationItem(BaseModel):
+    product_id: int
+    quantity: int = Field(..., gt=0)
+
+    class Config:
+        orm_mode = True
 
+class ReservationCreate(BaseModel):
+    items: List[ReservationItem] = Field(..., min_items=1)
+    ttl_seconds: Optional[int] = Field(None, gt=0)
+
+class ReservationRead(BaseModel):
+    id: str
+    status: str
+    expires_at: datetime
+    created_at: datetime
+    items: List[ReservationItem]
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,178 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Product, ReservationItem, StockReservation, StockReservationItem
+
+ACTIVE = "active"
+COMMITTED = "committed"
+RELEASED = "released"
+EXPIRED = "expired"
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id: int):
+        super().__init__(f"Stock insuficiente para el producto {product_id}")
+        self.product_id = product_id
+
+
+class InvalidReservationState(Exception):
+    def __init__(self, status: str):
+        super().__init__(f"La reserva está en estado '{status}'")
+        self.status = status
+
+
+def merge_items(items: Iterable) -> List[Tuple[int, int]]:
+    """Suma las cantidades de cada producto (ReservationItem o StockReservationItem) y ordena por id."""
+    quantities: Dict[int, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return sorted(quantities.items())
+
+
+async def take_stock(db: AsyncSession, merged: List[Tuple[int, int]]):
+    """
+    Descuenta el stock de cada (producto, cantidad) sin confirmar la transacción.
+
+    Cada producto se descuenta con un UPDATE condicional (`stock >= cantidad`), así
+    que solo se bloquea la fila afectada y nunca hay sobreventa. Las filas se
+    bloquean siempre en orden de id para que dos compras no se bloqueen mutuamente.
+    Lanza InsufficientStock en el primer producto que no alcanza; deshacer lo
+    descontado queda a cargo de quien llama.
+    """
+    for product_id, quantity in merged:
+        result = await db.execute(
+            update(Product)
+            .where(Product.id == product_id, Product.is_active == True, Product.stock >= quantity)
+            .values(stock=Product.stock - quantity)
+        )
+        if result.rowcount == 0:
+            raise InsufficientStock(product_id)
+
+
+async def reserve_stock(
+    db: AsyncSession, items: Iterable[ReservationItem], ttl_seconds: int, user_email: str
+) -> StockReservation:
+    """Descuenta el stock de todos los productos en una sola transacción, o de ninguno."""
+    merged = merge_items(items)
+    try:
+        await take_stock(db, merged)
+    except InsufficientStock:
+        await db.rollback()
+        raise
+
+    reservation = StockReservation(
+        id=uuid.uuid4().hex,
+        status=ACTIVE,
+        user_email=user_email,
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds),
+        items=[StockReservationItem(product_id=product_id, quantity=quantity) for product_id, quantity in merged],
+    )
+    db.add(reservation)
+    await db.commit()
+    return reservation
+
+
+async def _return_stock(db: AsyncSession, items: Iterable[StockReservationItem]):
+    # Mismo orden por id que al reservar, para no generar deadlocks
+    for product_id, quantity in merge_items(items):
+        await db.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(stock=Product.stock + quantity)
+        )
+
+
+def order_hold_id(order_id: int) -> str:
+    return f"order-{order_id}"
+
+
+def hold_order_stock(db: AsyncSession, order_id: int, merged: List[Tuple[int, int]]):
+    """
+    Registra lo descontado para una orden (evento order.created) como una reserva ya confirmada.
+
+    No vence ni se libera por la API de reservas: solo return_order_stock la devuelve
+    si el pago de la orden falla.
+    """
+    db.add(StockReservation(
+        id=order_hold_id(order_id),
+        status=COMMITTED,
+        expires_at=datetime.utcnow(),
+        items=[StockReservationItem(product_id=product_id, quantity=quantity) for product_id, quantity in merged],
+    ))
+
+
+async def return_order_stock(db: AsyncSession, order_id: int) -> List[int]:
+    """
+    Compensación de un pago fallido: devuelve el stock descontado para la orden.
+
+    No confirma la transacción (lo hace el consumidor de eventos). Devuelve los ids de
+    los productos afectados; una segunda llamada no tiene efecto.
+    """
+    reservation = await _lock_reservation(db, order_hold_id(order_id))
+    if reservation is None or reservation.status != COMMITTED:
+        return []
+    await _return_stock(db, reservation.items)
+    reservation.status = RELEASED
+    return [item.product_id for item in reservation.items]
+
+
+async def _lock_reservation(db: AsyncSession, reservation_id: str, user_email: Optional[str] = None):
+    # Con `user_email`, la reserva de otro usuario se trata como inexistente
+    query = select(StockReservation).where(StockReservation.id == reservation_id)
+    if user_email is not None:
+        query = query.where(StockReservation.user_email == user_email)
+    return (await db.execute(query.with_for_update())).scalar()
+
+
+async def release_reservation(db: AsyncSession, reservation_id: str, user_email: Optional[str] = None):
+    """Devuelve el stock de una reserva activa. Liberar dos veces no tiene efecto."""
+    reservation = await _lock_reservation(db, reservation_id, user_email)
+    if reservation is None:
+        return None
+    if reservation.status == ACTIVE:
+        await _return_stock(db, reservation.items)
+        reservation.status = RELEASED
+    elif reservation.status == COMMITTED:
+        await db.rollback()
+        raise InvalidReservationState(reservation.status)
+    await db.commit()
+    return reservation
+
+
+async def commit_reservation(db: AsyncSession, reservation_id: str, user_email: Optional[str] = None):
+    """Confirma la compra: el stock descontado ya no se devuelve."""
+    reservation = await _lock_reservation(db, reservation_id, user_email)
+    if reservation is None:
+        return None
+    if reservation.status == ACTIVE and reservation.expires_at <= datetime.utcnow():
+        # Venció aunque el barrido todavía no la haya procesado
+        await _return_stock(db, reservation.items)
+        reservation.status = EXPIRED
+        await db.commit()
+        raise InvalidReservationState(reservation.status)
+    if reservation.status not in (ACTIVE, COMMITTED):
+        await db.rollback()
+        raise InvalidReservationState(reservation.status)
+    reservation.status = COMMITTED
+    await db.commit()
+    return reservation
+
+
+async def expire_reservations(db: AsyncSession, batch_size: int) -> int:
+    """Devuelve el stock de un lote de reservas vencidas; las que otra réplica tiene bloqueadas se saltan."""
+    reservations = (await db.execute(
+        select(StockReservation)
+        .where(StockReservation.status == ACTIVE, StockReservation.expires_at <= datetime.utcnow())
+        .order_by(StockReservation.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )).scalars().all()
+    await _return_stock(db, [item for reservation in reservations for item in reservation.items])
+    for reservation in reservations:
+        reservation.status = EXPIRED
+    await db.commit()
+    return len(reservations)